@@ -331,7 +331,7 @@ async def generate_shot(req: GenerateShotRequest):
 @app.post("/api/generate/all", response_model=GenerateAllResponse, tags=["Generation"])
 async def generate_all_shots():
     """批量生成所有镜头"""
-    result = services.generation.generate_all()
+    result = await services.generation.generate_all_async()
 
     results = []
     for r in result.get("results", []):
@@ -16,6 +16,7 @@ import os
 import json
 import shutil
 import time
+import threading
 import gradio as gr
 from pathlib import Path
 from typing import List, Optional, Tuple, Dict, Any
@@ -23,7 +24,10 @@ from datetime import datetime
 import uuid
 import zipfile
 import base64
+import binascii
+import mmap
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 from models import (
     Character, Scene, Prop, StyleConfig, StyleMode,
@@ -37,6 +41,7 @@ from templates import (
 from prompt_generator import generate_shot_prompt, suggest_next_shot_template, generate_standard_shot_prompt, generate_standard_prompt_text
 from image_generator import create_generator, GenerationResult
 from smart_import import SmartImporter, FileParser, validate_and_fix_json
+from upload_utils import save_uploaded_image, save_multiple_images
 from settings import settings, needs_setup
 from setup_wizard import run_wizard
 from canghe_api import CangheAPIClient, VideoModel
@@ -132,11 +137,13 @@ AUTO_SAVE_FILE = os.path.join(PROJECTS_DIR, "_autosave.json")
 
 # 用户配置文件路径（保存 API Key 等设置）
 USER_CONFIG_FILE = os.path.join(PROJECTS_DIR, "_user_config.json")
+# 上次写入磁盘的用户配置 JSON，内容未变时跳过重复写文件
+_last_saved_user_config = None
 
 
 def save_user_config():
     """保存用户配置（API Key、模型选择等）"""
-    global API_CONFIG, _canghe_unified_config
+    global API_CONFIG, _canghe_unified_config, _last_saved_user_config
     try:
         from image_generator import _canghe_api_key, _current_canghe_model
         from ai_creative_generator import _llm_provider, _llm_api_key
@@ -152,8 +159,13 @@ def save_user_config():
             "canghe_unified": _canghe_unified_config
         }
 
+        config_json = json.dumps(config, ensure_ascii=False, indent=2)
+        if config_json == _last_saved_user_config and os.path.exists(USER_CONFIG_FILE):
+            return True
+
         with open(USER_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+            f.write(config_json)
+        _last_saved_user_config = config_json
         print(f"[用户配置] 已保存配置")
         return True
     except Exception as e:
@@ -396,9 +408,8 @@ def auto_save_project() -> bool:
         return False
 
     try:
-        project_data = current_project.to_dict()
-        with open(AUTO_SAVE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(project_data, f, ensure_ascii=False, indent=2)
+        with open(AUTO_SAVE_FILE, 'wb') as f:
+            current_project.write_json(f)
         print(f"[自动保存] 项目已保存: {current_project.name}")
         return True
     except Exception as e:
@@ -413,9 +424,8 @@ def manual_save_project() -> str:
         return "❌ 没有项目可保存"
 
     try:
-        project_data = current_project.to_dict()
-        with open(AUTO_SAVE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(project_data, f, ensure_ascii=False, indent=2)
+        with open(AUTO_SAVE_FILE, 'wb') as f:
+            current_project.write_json(f)
 
         # 统计信息
         total_shots = len(current_project.shots)
@@ -1090,49 +1100,6 @@ footer { display: none !important; }
 """
 
 
-# ========================================
-# 工具函数
-# ========================================
-
-def save_uploaded_image(image, category: str, name: str) -> str:
-    """保存上传的图片"""
-    if image is None:
-        return ""
-
-    save_dir = ASSETS_DIR / category
-    save_dir.mkdir(parents=True, exist_ok=True)
-
-    ext = ".png"
-    filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
-    save_path = save_dir / filename
-
-    if isinstance(image, str):
-        if os.path.exists(image):
-            shutil.copy(image, save_path)
-    else:
-        try:
-            from PIL import Image
-            if hasattr(image, 'save'):
-                image.save(save_path)
-            else:
-                Image.fromarray(image).save(save_path)
-        except:
-            return ""
-
-    return str(save_path)
-
-
-def save_multiple_images(images: List, category: str, name: str) -> List[str]:
-    """批量保存图片"""
-    paths = []
-    if images:
-        for i, img in enumerate(images):
-            path = save_uploaded_image(img, category, f"{name}_{i}")
-            if path:
-                paths.append(path)
-    return paths
-
-
 # ========================================
 # 核心功能函数
 # ========================================
@@ -1914,6 +1881,33 @@ def add_shot_simple(
     return f"✓ 镜头 {shot.shot_number} 已添加", get_shot_list(), shot.generated_prompt, standard_prompt_text
 
 
+# 图像生成器缓存: 配置不变时复用同一个生成器 (及其连接池和后台事件循环),
+# 配置变化时关闭旧实例, 避免每次生成都新建并泄漏连接
+_generator_lock = threading.Lock()
+_cached_generator = None
+_cached_generator_key = None
+
+
+def _get_generator(api_key: str):
+    """获取当前配置对应的图像生成器 (create_generator 失败时抛出 ValueError)"""
+    global _cached_generator, _cached_generator_key
+    key = (
+        api_key,
+        str(OUTPUTS_DIR),
+        IMAGE_BACKEND,
+        tuple(sorted((k, str(v)) for k, v in _canghe_unified_config.items()))
+    )
+    with _generator_lock:
+        if _cached_generator is not None and _cached_generator_key == key:
+            return _cached_generator
+        stale = _cached_generator
+        _cached_generator = create_generator(api_key, str(OUTPUTS_DIR))
+        _cached_generator_key = key
+    if stale is not None:
+        stale.close()
+    return _cached_generator
+
+
 def generate_single_shot(shot_num: int, custom_prompt: str = "") -> Tuple[str, Optional[str]]:
     """生成单个镜头"""
     global current_project, cli_output_history
@@ -1950,7 +1944,7 @@ def generate_single_shot(shot_num: int, custom_prompt: str = "") -> Tuple[str, O
     cli_output_history.append(f"[图像生成] 提示词: {prompt[:60]}...")
 
     try:
-        generator = create_generator(effective_api_key, str(OUTPUTS_DIR))
+        generator = _get_generator(effective_api_key)
     except ValueError as e:
         cli_output_history.append(f"[图像生成] ✗ 创建生成器失败: {str(e)}")
         return f"创建生成器失败: {str(e)}", None
@@ -1987,25 +1981,27 @@ def generate_all_shots() -> str:
     if not current_project.shots:
         return "请先添加镜头", []
 
-    generator = create_generator(API_KEY, str(OUTPUTS_DIR))
+    generator = _get_generator(API_KEY)
     success = 0
     total = len(current_project.shots)
     cli_output_history.append(f"[批量生成] 开始生成 {total} 个镜头...")
 
-    for i, shot in enumerate(current_project.shots):
-        if not shot.output_image:
-            if not shot.generated_prompt:
-                shot.generated_prompt = generate_shot_prompt(shot, current_project)
+    pending = [shot for shot in current_project.shots if not shot.output_image]
+    for shot in pending:
+        if not shot.generated_prompt:
+            shot.generated_prompt = generate_shot_prompt(shot, current_project)
 
-            cli_output_history.append(f"[批量生成] 正在生成镜头 {i+1}/{total}...")
-            result = generator.generate_shot(shot, current_project, shot.generated_prompt)
-            if result.success:
-                shot.output_image = result.image_path
-                shot.consistency_score = result.consistency_score
-                success += 1
-                cli_output_history.append(f"[批量生成] ✓ 镜头 {i+1} 完成")
-            else:
-                cli_output_history.append(f"[批量生成] ✗ 镜头 {i+1} 失败")
+    def on_progress(i: int, count: int, message: str):
+        cli_output_history.append(f"[批量生成] {message} ({i+1}/{count})")
+
+    # 批量接口: 苍何后端并发请求, ComfyUI 后端流水线提交; 成功的镜头由生成器写回
+    results = generator.generate_all_shots(current_project, {}, on_progress, shots=pending) if pending else []
+    for shot, result in zip(pending, results):
+        if result.success:
+            success += 1
+            cli_output_history.append(f"[批量生成] ✓ 镜头 {shot.shot_number} 完成")
+        else:
+            cli_output_history.append(f"[批量生成] ✗ 镜头 {shot.shot_number} 失败")
 
     auto_save_project()  # 自动保存
     cli_output_history.append(f"[批量生成] 完成: {success}/{total} 个镜头成功")
@@ -2461,22 +2457,18 @@ def generate_video_from_shot(
                         subfolder, filename = "video", output_file
 
                     log_lines.append(f"> [下载] 从 ComfyUI 下载: subfolder={subfolder}, filename={filename}")
-                    video_data = service.comfyui_client.get_image(filename, subfolder=subfolder, folder_type="output")
-
-                    if video_data and shot.output_image:
-                        dest_path = os.path.splitext(shot.output_image)[0] + ".mp4"
-                        try:
-                            with open(dest_path, 'wb') as f:
-                                f.write(video_data)
-                            log_lines.append(f"> [保存] 视频已保存到: {dest_path}")
-                            video_path = dest_path
-                            # 保存视频路径到 shot 并自动保存项目
-                            shot.output_video = dest_path
-                            auto_save_project()
-                            log_lines.append(f"> [自动保存] 项目已保存")
-                            break
-                        except Exception as save_err:
-                            log_lines.append(f"> [警告] 保存视频失败: {save_err}")
+                    # 直接流式写入目标文件，避免整段视频驻留内存
+                    dest_path = os.path.splitext(shot.output_image)[0] + ".mp4" if shot.output_image else None
+                    if dest_path and service.comfyui_client.download_image_to(
+                        filename, dest_path, subfolder=subfolder, folder_type="output"
+                    ):
+                        log_lines.append(f"> [保存] 视频已保存到: {dest_path}")
+                        video_path = dest_path
+                        # 保存视频路径到 shot 并自动保存项目
+                        shot.output_video = dest_path
+                        auto_save_project()
+                        log_lines.append(f"> [自动保存] 项目已保存")
+                        break
                     else:
                         log_lines.append(f"> [警告] 无法从 ComfyUI 下载视频或无输出图片路径")
 
@@ -3116,8 +3108,8 @@ def export_project_multi_format(format_type: str) -> Tuple[str, Optional[str]]:
         json_name = f"{current_project.name}_{timestamp}.json"
         json_path = EXPORTS_DIR / json_name
 
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(current_project.to_dict(), f, ensure_ascii=False, indent=2)
+        with open(json_path, "wb") as f:
+            current_project.write_json(f)
 
         return f"✓ 已导出: {json_path}", str(json_path)
 
@@ -3209,7 +3201,7 @@ def export_project_multi_format(format_type: str) -> Tuple[str, Optional[str]]:
 
         with zipfile.ZipFile(backup_path, 'w') as zf:
             # 项目文件
-            zf.writestr("project.json", json.dumps(current_project.to_dict(), ensure_ascii=False, indent=2))
+            zf.writestr("project.json", current_project.dump_json())
 
             # 输出图片
             for shot in current_project.shots:
@@ -3235,7 +3227,7 @@ def export_project_multi_format(format_type: str) -> Tuple[str, Optional[str]]:
 
         with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zf:
             # 项目文件
-            zf.writestr("project.json", json.dumps(current_project.to_dict(), ensure_ascii=False, indent=2))
+            zf.writestr("project.json", current_project.dump_json())
 
             # 生成分镜脚本文本
             script_lines = [
@@ -3755,6 +3747,97 @@ def get_step_summary(step: int) -> str:
     return ""
 
 
+# 卡片缩略图 data URI 缓存: (路径, mtime, 大小) -> data URI
+# 同一张图在每次刷新卡片时都会重新嵌入, 文件未变化时无需重复读取和 base64 编码
+_IMAGE_MIME_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}
+# 缓存按总字节数限额: 每条都是整张原图的 base64, 单条可达数 MB, 按条数限制会占用 GB 级内存
+_DATA_URI_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_MMAP_MIN_SIZE = 64 * 1024  # 小文件直接 read, 省去 mmap 的建立开销
+_B64_CHUNK_SIZE = 3 * 64 * 1024  # 3 的整数倍, 分块编码不会在块间产生填充
+_data_uri_cache: Dict[Tuple[str, int, int], str] = {}
+_data_uri_cache_bytes = 0
+_data_uri_cache_lock = threading.Lock()
+# 缩略图编码线程池 (读文件与 base64 编码均在 C 层释放 GIL, 多张图可并行)
+_encode_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def _encode_data_uri(image_path: str, size: int) -> str:
+    """读取图片并编码为 data URI (无缓存, 可在线程池中执行)"""
+    ext = image_path.lower().split('.')[-1]
+    mime_type = _IMAGE_MIME_TYPES.get(ext, 'image/png')
+    with open(image_path, "rb") as img_file:
+        if size < _MMAP_MIN_SIZE:
+            img_data = base64.b64encode(img_file.read()).decode('ascii')
+            return f"data:{mime_type};base64,{img_data}"
+        # 大图: 映射文件后分块编码, 写入按最终长度预分配的缓冲区 (含前缀),
+        # 最后只解码一次, 避免中间 bytes/str 副本同时驻留内存
+        with mmap.mmap(img_file.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            prefix = f"data:{mime_type};base64,".encode('ascii')
+            total = len(view)
+            out = bytearray(len(prefix) + (total + 2) // 3 * 4)
+            out[:len(prefix)] = prefix
+            pos = len(prefix)
+            for offset in range(0, total, _B64_CHUNK_SIZE):
+                encoded = binascii.b2a_base64(view[offset:offset + _B64_CHUNK_SIZE], newline=False)
+                out[pos:pos + len(encoded)] = encoded
+                pos += len(encoded)
+    return out.decode('ascii')
+
+
+def _store_data_uri(key: Tuple[str, int, int], data_uri: str) -> None:
+    global _data_uri_cache_bytes
+    size = len(data_uri)  # data URI 为纯 ASCII, 长度即字节数
+    if size > _DATA_URI_CACHE_MAX_BYTES:
+        return  # 超出整个限额的单张图不缓存
+    with _data_uri_cache_lock:
+        if key in _data_uri_cache:
+            return
+        while _data_uri_cache and _data_uri_cache_bytes + size > _DATA_URI_CACHE_MAX_BYTES:
+            # 淘汰最早加入的条目
+            _data_uri_cache_bytes -= len(_data_uri_cache.pop(next(iter(_data_uri_cache))))
+        _data_uri_cache[key] = data_uri
+        _data_uri_cache_bytes += size
+
+
+def _image_data_uri(image_path: str) -> str:
+    """读取图片并编码为 data URI (按文件 mtime/大小缓存)"""
+    st = os.stat(image_path)
+    key = (image_path, st.st_mtime_ns, st.st_size)
+    data_uri = _data_uri_cache.get(key)
+    if data_uri is None:
+        data_uri = _encode_data_uri(image_path, st.st_size)
+        _store_data_uri(key, data_uri)
+    return data_uri
+
+
+def _prefetch_card_images(image_paths: List[str]) -> None:
+    """并行预编码尚未缓存的卡片缩略图, 之后逐张渲染时直接命中缓存"""
+    if not settings.inline_card_images:
+        return
+    pending = []
+    for image_path in image_paths:
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            continue
+        key = (image_path, st.st_mtime_ns, st.st_size)
+        if key not in _data_uri_cache:
+            pending.append((key, _encode_pool.submit(_encode_data_uri, image_path, st.st_size)))
+    # 在调用线程中写回缓存, 工作线程只负责编码
+    for key, future in pending:
+        try:
+            _store_data_uri(key, future.result())
+        except Exception:
+            pass  # 失败留给渲染时按单张路径重试并报告
+
+
+def _card_image_src(image_path: str) -> str:
+    """卡片缩略图的 src: 内嵌 data URI, 或 Gradio 文件路由 URL (原始字节, 无 base64 膨胀)"""
+    if settings.inline_card_images:
+        return _image_data_uri(image_path)
+    return "/gradio_api/file=" + image_path.replace("\\", "/")
+
+
 def get_video_cards_html() -> str:
     """生成视频镜头卡片HTML，样式与图片镜头一致，底色线框区分"""
     if current_project is None or len(current_project.shots) == 0:
@@ -3762,6 +3845,8 @@ def get_video_cards_html() -> str:
 
     cards_html = '<div class="video-cards-container">'
 
+    _prefetch_card_images([shot.output_image for shot in current_project.shots if shot.output_image])
+
     video_count = 0
     videos_data = []  # 收集视频数据用于弹窗
     for i, shot in enumerate(current_project.shots, 1):
@@ -3807,11 +3892,7 @@ def get_video_cards_html() -> str:
         # 缩略图（使用原图作为视频封面）
         if has_image:
             try:
-                with open(shot.output_image, "rb") as img_file:
-                    img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                ext = shot.output_image.lower().split('.')[-1]
-                mime_type = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}.get(ext, 'image/png')
-                img_data_uri = f"data:{mime_type};base64,{img_data}"
+                img_data_uri = _card_image_src(shot.output_image)
                 thumb_html = f'<img src="{img_data_uri}" class="video-thumb" />'
                 if has_video:
                     thumb_html = f'<div class="video-thumb-wrapper">{thumb_html}<div class="video-play-icon">▶</div></div>'
@@ -4097,12 +4178,36 @@ def get_video_stats_html() -> str:
     '''
 
 
+# 镜头卡片行模板 (模块级预构建, 每行一次 format_map)
+_SHOT_CARD_FMT = '''
+        <div class="shot-card {status_class}" data-shot-num="{num}">
+            <div class="shot-card-header">
+                <span class="shot-num">镜头 {num}</span>
+                <span class="shot-status">{status_icon}</span>
+            </div>
+            <div class="shot-thumb-container">
+                {thumb_html}
+            </div>
+            <div class="shot-desc">{desc_short}</div>
+            {video_btn_html}
+        </div>
+        '''
+
+_SHOT_VIDEO_BTN_FMT = '''
+            <button class="shot-video-btn" data-shot-num="{num}" onclick="event.stopPropagation(); window.generateShotVideo({num});">
+                🎬 生成视频
+            </button>
+            '''
+
+
 def get_shot_cards_html() -> str:
     """生成镜头卡片HTML，每个镜头显示缩略图和生成按钮，支持点击弹窗预览"""
     if current_project is None or len(current_project.shots) == 0:
         return '<div class="no-shots">暂无镜头，请先在编排页添加镜头</div>'
 
-    cards_html = '<div class="shot-cards-container">'
+    card_parts = ['<div class="shot-cards-container">']
+
+    _prefetch_card_images([shot.output_image for shot in current_project.shots if shot.output_image])
 
     # 存储每个镜头的完整数据用于弹窗
     shots_data = []
@@ -4117,13 +4222,9 @@ def get_shot_cards_html() -> str:
         if has_image:
             try:
                 print(f"[卡片] 加载镜头 {i} 图片: {shot.output_image}")
-                with open(shot.output_image, "rb") as img_file:
-                    img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                ext = shot.output_image.lower().split('.')[-1]
-                mime_type = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}.get(ext, 'image/png')
-                img_data_uri = f"data:{mime_type};base64,{img_data}"
+                img_data_uri = _card_image_src(shot.output_image)
                 thumb_html = f'<img src="{img_data_uri}" class="shot-thumb" />'
-                print(f"[卡片] ✓ 镜头 {i} 图片加载成功, base64 长度: {len(img_data)}")
+                print(f"[卡片] ✓ 镜头 {i} 图片加载成功, src 长度: {len(img_data_uri)}")
             except Exception as e:
                 print(f"[卡片] ✗ 镜头 {i} 图片加载失败: {e}")
                 thumb_html = '<div class="shot-thumb-placeholder">⚠️<br/>加载失败</div>'
@@ -4173,29 +4274,19 @@ def get_shot_cards_html() -> str:
         shots_data.append(shot_info)
 
         # 视频生成按钮（仅当已生成图片时显示）
-        video_btn_html = ""
-        if has_image:
-            video_btn_html = f'''
-            <button class="shot-video-btn" data-shot-num="{i}" onclick="event.stopPropagation(); window.generateShotVideo({i});">
-                🎬 生成视频
-            </button>
-            '''
-
-        cards_html += f'''
-        <div class="shot-card {status_class}" data-shot-num="{i}">
-            <div class="shot-card-header">
-                <span class="shot-num">镜头 {i}</span>
-                <span class="shot-status">{status_icon}</span>
-            </div>
-            <div class="shot-thumb-container">
-                {thumb_html}
-            </div>
-            <div class="shot-desc">{desc_short}</div>
-            {video_btn_html}
-        </div>
-        '''
+        video_btn_html = _SHOT_VIDEO_BTN_FMT.format_map({"num": i}) if has_image else ""
 
-    cards_html += '</div>'
+        card_parts.append(_SHOT_CARD_FMT.format_map({
+            "num": i,
+            "status_class": status_class,
+            "status_icon": status_icon,
+            "thumb_html": thumb_html,
+            "desc_short": desc_short,
+            "video_btn_html": video_btn_html,
+        }))
+
+    card_parts.append('</div>')
+    cards_html = "".join(card_parts)
 
     # 将镜头数据传递给全局 JavaScript
     # 使用 ensure_ascii=True 确保中文字符以 \uXXXX 形式转义
@@ -8,12 +8,17 @@ import os
 import json
 import uuid
 import time
-import base64
+import binascii
+import mimetypes
+import select
+import shutil
 import requests
 import websocket
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple, Callable
 from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 try:
@@ -21,8 +26,110 @@ try:
 except ImportError:
     Image = None
 
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    _loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+# Progress frames fire many times per sampler step; skip parsing them when nobody listens
+_PROGRESS_PREFIXES = (b'{"type": "progress"', b'{"type":"progress"')
+
+# Sentinel for "not detected yet" (distinct from a detected empty model name)
+_UNSET = object()
+
+# How long the checkpoint list from object_info stays valid
+MODELS_CACHE_TTL = 300  # seconds
+
+
+# (settings instance, config) memo for ComfyUIConfig.from_settings
+_settings_config = None
+
+
+def _guess_image_mime(path: str) -> str:
+    """MIME type from the file extension, defaulting to PNG"""
+    return mimetypes.guess_type(path)[0] or 'image/png'
+
+
+def _resolve_seed(seed: int) -> int:
+    """Return seed, or a time-based 32-bit seed when seed is negative (random)"""
+    return seed if seed >= 0 else int(time.time() * 1000) & 0xFFFFFFFF
+
+
+# ==================== Custom workflow injectors ====================
+# Each injector takes (inputs, params, seed) and returns True if it set the prompt.
+
+def _inject_primitive_string(inputs: Dict, params: 'GenerationParams', seed: int) -> bool:
+    """Inject prompt - PrimitiveStringMultiline (Z-Image style)"""
+    if 'value' in inputs:
+        inputs['value'] = params.prompt
+        return True
+    return False
+
+
+def _inject_clip_text(inputs: Dict, params: 'GenerationParams', seed: int) -> bool:
+    """Inject prompt - CLIPTextEncode (standard style)"""
+    text = inputs.get('text')
+    # Only inject if it's a string (not a connection)
+    if isinstance(text, str):
+        if text == '' or text == 'positive':
+            inputs['text'] = params.prompt
+            return True
+        elif text == 'negative':
+            inputs['text'] = params.negative_prompt
+    return False
 
-@dataclass
+
+def _inject_latent_size(inputs: Dict, params: 'GenerationParams', seed: int) -> bool:
+    """Inject dimensions - EmptyLatentImage / EmptySD3LatentImage"""
+    if 'width' in inputs:
+        inputs['width'] = params.width
+    if 'height' in inputs:
+        inputs['height'] = params.height
+    return False
+
+
+def _inject_ksampler(inputs: Dict, params: 'GenerationParams', seed: int) -> bool:
+    """Inject sampler settings - KSampler"""
+    if 'seed' in inputs:
+        inputs['seed'] = seed
+    # Note: Don't override steps/cfg if using custom workflow
+    # as they may be tuned specifically for that workflow
+    return False
+
+
+# LoadImage is not listed: reference images are uploaded and set in image_to_image
+_INJECTORS: Dict[str, Callable[[Dict, 'GenerationParams', int], bool]] = {
+    'PrimitiveStringMultiline': _inject_primitive_string,
+    'CLIPTextEncode': _inject_clip_text,
+    'EmptyLatentImage': _inject_latent_size,
+    'EmptySD3LatentImage': _inject_latent_size,
+    'KSampler': _inject_ksampler,
+}
+
+
+def _build_injection_plan(workflow: Dict) -> List[Tuple[str, Callable]]:
+    """List (node_id, injector) for the workflow nodes that take parameters"""
+    plan = []
+    for node_id, node in workflow.items():
+        injector = _INJECTORS.get(node.get('class_type', ''))
+        if injector is not None:
+            plan.append((node_id, injector))
+    return plan
+
+
+@dataclass(slots=True)
 class ComfyUIConfig:
     """ComfyUI configuration"""
     host: str = "127.0.0.1"
@@ -33,6 +140,7 @@ class ComfyUIConfig:
     workflow_file: Optional[str] = None  # Direct path to a workflow JSON file
     enabled: bool = True  # Whether ComfyUI integration is enabled
     model: str = ""  # Default model name (empty = auto-detect)
+    output_dir: Optional[str] = None  # ComfyUI's own output directory, if on this machine
 
     @property
     def base_url(self) -> str:
@@ -44,33 +152,59 @@ class ComfyUIConfig:
         protocol = "wss" if self.use_https else "ws"
         return f"{protocol}://{self.host}:{self.port}/ws"
 
+    @property
+    def has_local_output(self) -> bool:
+        """Whether output files can be read straight from ComfyUI's output directory"""
+        return bool(self.output_dir) and self.host in ("127.0.0.1", "localhost")
+
     @classmethod
     def from_settings(cls) -> 'ComfyUIConfig':
-        """Create config from settings module"""
+        """Create config from settings module (memoized per settings instance)"""
+        global _settings_config
         try:
             from settings import settings
-            # Get workflow file path
-            workflow_file = None
-            if settings.comfyui_workflow_file:
-                wf_path = Path(settings.comfyui_workflow_file)
-                if wf_path.is_absolute():
-                    workflow_file = str(wf_path)
-                else:
-                    workflow_file = str(settings.base_dir / settings.comfyui_workflow_file)
-
-            return cls(
-                host=settings.comfyui_host or "127.0.0.1",
-                port=settings.comfyui_port or 8188,
-                workflow_dir=str(settings.comfyui_workflows_dir) if settings.comfyui_workflows_dir else None,
-                workflow_file=workflow_file,
-                enabled=settings.comfyui_enabled,
-                model=settings.comfyui_model or ""
-            )
         except ImportError:
             return cls()
 
+        # reload_settings() rebinds the settings singleton, which invalidates the memo
+        if _settings_config is not None and _settings_config[0] is settings:
+            return _settings_config[1]
+
+        config = cls._build_from_settings(settings)
+        _settings_config = (settings, config)
+        return config
+
+    @classmethod
+    def reload(cls) -> 'ComfyUIConfig':
+        """Discard the memoized settings config and rebuild it"""
+        global _settings_config
+        _settings_config = None
+        return cls.from_settings()
+
+    @classmethod
+    def _build_from_settings(cls, settings) -> 'ComfyUIConfig':
+        """Build config from a Settings instance"""
+        # Get workflow file path
+        workflow_file = None
+        if settings.comfyui_workflow_file:
+            wf_path = Path(settings.comfyui_workflow_file)
+            if wf_path.is_absolute():
+                workflow_file = str(wf_path)
+            else:
+                workflow_file = str(settings.base_dir / settings.comfyui_workflow_file)
+
+        return cls(
+            host=settings.comfyui_host or "127.0.0.1",
+            port=settings.comfyui_port or 8188,
+            workflow_dir=str(settings.comfyui_workflows_dir) if settings.comfyui_workflows_dir else None,
+            workflow_file=workflow_file,
+            enabled=settings.comfyui_enabled,
+            model=settings.comfyui_model or "",
+            output_dir=settings.comfyui_output_dir or None
+        )
 
-@dataclass
+
+@dataclass(slots=True)
 class GenerationParams:
     """Image generation parameters"""
     prompt: str = ""
@@ -89,7 +223,7 @@ class GenerationParams:
     ref_strength: float = 0.75  # For img2img
 
 
-@dataclass
+@dataclass(slots=True)
 class GenerationResult:
     """Result of image generation"""
     success: bool = False
@@ -99,6 +233,59 @@ class GenerationResult:
     generation_time: float = 0.0
 
 
+@dataclass(slots=True)
+class _WaitState:
+    """Progress of one wait_for_completion run"""
+    progress_callback: Optional[Callable[[int, int], None]] = None
+    output_images: List[str] = field(default_factory=list)
+    execution_error: Optional[str] = None
+
+
+# ==================== WebSocket message handlers ====================
+# Each handler takes (message, state) and returns True when waiting is over.
+
+def _on_progress(data: Dict, state: _WaitState) -> bool:
+    if state.progress_callback:
+        progress = data['data']
+        state.progress_callback(progress.get('value', 0), progress.get('max', 100))
+    return False
+
+
+def _on_executing(data: Dict, state: _WaitState) -> bool:
+    # node is None once execution finished
+    return data['data'].get('node', '') is None
+
+
+def _on_executed(data: Dict, state: _WaitState) -> bool:
+    node_output = data['data'].get('output', {})
+    # Images, videos (video generation workflows) and gifs
+    for key in ('images', 'videos', 'gifs'):
+        for item in node_output.get(key, []):
+            filename = item.get('filename', '')
+            subfolder = item.get('subfolder', '')
+            # Outputs saved in a subfolder are reported as 'subfolder/filename'
+            state.output_images.append(f"{subfolder}/{filename}" if subfolder and filename else filename)
+    return False
+
+
+def _on_execution_error(data: Dict, state: _WaitState) -> bool:
+    error_data = data.get('data', {})
+    message = error_data.get('exception_message', 'Unknown execution error')
+    node_id = error_data.get('node_id', 'unknown')
+    node_type = error_data.get('node_type', 'unknown')
+    state.execution_error = f"Node {node_id} ({node_type}): {message}"
+    return True
+
+
+# Other types (e.g. execution_cached, status) need no handling
+_WS_HANDLERS: Dict[str, Callable[[Dict, _WaitState], bool]] = {
+    'progress': _on_progress,
+    'executing': _on_executing,
+    'executed': _on_executed,
+    'execution_error': _on_execution_error,
+}
+
+
 class ComfyUIClient:
     """
     ComfyUI API Client
@@ -237,14 +424,39 @@ class ComfyUIClient:
         self.config = config or ComfyUIConfig()
         self.client_id = str(uuid.uuid4())
         self.custom_workflow: Optional[Dict] = None
-        self._workflow_cache: Dict[str, Dict] = {}  # Cache loaded workflows
-        self._available_models: Optional[List[str]] = None
-        self._default_model: Optional[str] = None
+        self._custom_workflow_bytes: Optional[bytes] = None  # Serialized custom_workflow, cloned per generation
+        self._injection_plan: Optional[Tuple[int, List[Tuple[str, Callable]]]] = None  # (id(custom_workflow), plan)
+        self._workflow_cache: Dict[str, Tuple[float, Dict, bytes]] = {}  # path -> (mtime, workflow, raw JSON)
+        self._available_models: Optional[List[str]] = None  # Cached get_models() result
+        self._models_cache_ts: float = 0.0
+        self._default_model = _UNSET
+
+        # Endpoint URLs, built once from the config
+        base_url = self.config.base_url
+        self._url_stats = base_url + "/system_stats"
+        self._url_models = base_url + "/object_info/CheckpointLoaderSimple"
+        self._url_upload = base_url + "/upload/image"
+        self._url_prompt = base_url + "/prompt"
+        self._url_view = base_url + "/view"
+        self._url_interrupt = base_url + "/interrupt"
+        self._url_queue = base_url + "/queue"
+        self._url_ws_base = self.config.ws_url + "?clientId="
+        self._url_ws = self._url_ws_base + self.client_id
+
+        # Pooled keep-alive session shared by all REST calls
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
         # Auto-load workflow file if configured
         if self.config.workflow_file:
             self._load_configured_workflow()
 
+        # Warm the workflow cache so switching workflows in the UI skips disk reads
+        if self.config.workflow_dir:
+            self.preload_workflows()
+
     def _load_configured_workflow(self):
         """Load the configured workflow file"""
         if not self.config.workflow_file:
@@ -253,12 +465,15 @@ class ComfyUIClient:
         workflow_path = Path(self.config.workflow_file)
         if workflow_path.exists():
             try:
-                with open(workflow_path, 'r', encoding='utf-8') as f:
-                    self.custom_workflow = json.load(f)
+                self._use_workflow_file(str(workflow_path))
                 print(f"[ComfyUI] Loaded custom workflow: {workflow_path.name}")
             except Exception as e:
                 print(f"[ComfyUI] Failed to load workflow: {e}")
 
+    def close(self):
+        """Close the pooled HTTP session"""
+        self._session.close()
+
     def is_enabled(self) -> bool:
         """Check if ComfyUI integration is enabled"""
         return self.config.enabled
@@ -274,13 +489,13 @@ class ComfyUIClient:
             return self.config.model
 
         # Auto-detect first available model
-        if self._default_model is None:
+        if self._default_model is _UNSET:
             models = self.get_models()
-            if models:
-                self._default_model = models[0]
-                print(f"[ComfyUI] Auto-detected model: {self._default_model}")
-            else:
-                self._default_model = ""
+            if not models:
+                # Not cached, so a later call can pick up a model once the server has one
+                return ""
+            self._default_model = models[0]
+            print(f"[ComfyUI] Auto-detected model: {self._default_model}")
 
         return self._default_model
 
@@ -289,13 +504,15 @@ class ComfyUIClient:
         if not self.config.workflow_dir:
             return []
 
-        workflow_path = Path(self.config.workflow_dir)
-        if not workflow_path.exists():
+        try:
+            with os.scandir(self.config.workflow_dir) as entries:
+                # Return name without .json extension; DirEntry.is_file uses the cached dirent type
+                workflows = [
+                    entry.name[:-5] for entry in entries
+                    if entry.name.endswith('.json') and entry.is_file()
+                ]
+        except OSError:
             return []
-
-        workflows = []
-        for f in workflow_path.glob("*.json"):
-            workflows.append(f.stem)  # Return name without .json extension
         return sorted(workflows)
 
     def load_workflow(self, name: str) -> Tuple[bool, str]:
@@ -327,24 +544,47 @@ class ComfyUIClient:
         Returns:
             Workflow dict or None
         """
-        if name in self._workflow_cache:
-            return self._workflow_cache[name]
-
         if not self.config.workflow_dir:
             return None
 
-        workflow_path = Path(self.config.workflow_dir) / f"{name}.json"
-        if not workflow_path.exists():
-            return None
-
+        workflow_path = os.path.join(self.config.workflow_dir, f"{name}.json")
         try:
-            with open(workflow_path, 'r', encoding='utf-8') as f:
-                workflow = json.load(f)
-            self._workflow_cache[name] = workflow
-            return workflow
+            return self._read_workflow(workflow_path)[0]
         except Exception:
             return None
 
+    def _read_workflow(self, path: str) -> Tuple[Dict, bytes]:
+        """
+        Read a workflow JSON file through the mtime-checked cache
+
+        Returns: (workflow, raw JSON bytes); raises OSError/ValueError on failure
+        """
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime
+        cached = self._workflow_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        workflow = _loads(raw)
+        self._workflow_cache[path] = (mtime, workflow, raw)
+        return workflow, raw
+
+    def preload_workflows(self) -> int:
+        """Parse every workflow in the workflow directory into the cache; returns the count"""
+        if not self.config.workflow_dir:
+            return 0
+
+        loaded = 0
+        for name in self.list_workflows():
+            try:
+                self._read_workflow(os.path.join(self.config.workflow_dir, f"{name}.json"))
+                loaded += 1
+            except Exception:
+                continue
+        return loaded
+
     def clear_workflow_cache(self):
         """Clear the workflow cache"""
         self._workflow_cache.clear()
@@ -355,8 +595,8 @@ class ComfyUIClient:
         Returns: (success, message)
         """
         try:
-            response = requests.get(
-                f"{self.config.base_url}/system_stats",
+            response = self._session.get(
+                self._url_stats,
                 timeout=5
             )
             if response.status_code == 200:
@@ -370,19 +610,31 @@ class ComfyUIClient:
             return False, f"Connection error: {str(e)}"
 
     def get_models(self) -> List[str]:
-        """Get available checkpoint models"""
+        """Get available checkpoint models (cached for MODELS_CACHE_TTL seconds)"""
+        if self._available_models is not None and time.time() - self._models_cache_ts < MODELS_CACHE_TTL:
+            return list(self._available_models)
+
         try:
-            response = requests.get(
-                f"{self.config.base_url}/object_info/CheckpointLoaderSimple",
+            response = self._session.get(
+                self._url_models,
                 timeout=10
             )
             if response.status_code == 200:
                 data = response.json()
-                return data.get("CheckpointLoaderSimple", {}).get("input", {}).get("required", {}).get("ckpt_name", [[]])[0]
+                models = data.get("CheckpointLoaderSimple", {}).get("input", {}).get("required", {}).get("ckpt_name", [[]])[0]
+                self._available_models = models
+                self._models_cache_ts = time.time()
+                return list(models)
             return []
         except:
             return []
 
+    def clear_model_cache(self):
+        """Forget the cached model list and auto-detected default model"""
+        self._available_models = None
+        self._models_cache_ts = 0.0
+        self._default_model = _UNSET
+
     def upload_image(self, image_path: str, subfolder: str = "") -> Tuple[bool, str]:
         """
         Upload image to ComfyUI
@@ -393,19 +645,27 @@ class ComfyUIClient:
 
         try:
             with open(image_path, 'rb') as f:
-                files = {
-                    'image': (os.path.basename(image_path), f, 'image/png')
-                }
+                image_field = (os.path.basename(image_path), f, _guess_image_mime(image_path))
                 data = {}
                 if subfolder:
                     data['subfolder'] = subfolder
 
-                response = requests.post(
-                    f"{self.config.base_url}/upload/image",
-                    files=files,
-                    data=data,
-                    timeout=30
-                )
+                if MultipartEncoder is not None:
+                    # Stream the multipart body chunk by chunk instead of building it in memory
+                    encoder = MultipartEncoder(fields={'image': image_field, **data})
+                    response = self._session.post(
+                        self._url_upload,
+                        data=encoder,
+                        headers={'Content-Type': encoder.content_type},
+                        timeout=30
+                    )
+                else:
+                    response = self._session.post(
+                        self._url_upload,
+                        files={'image': image_field},
+                        data=data,
+                        timeout=30
+                    )
 
             if response.status_code == 200:
                 result = response.json()
@@ -418,30 +678,45 @@ class ComfyUIClient:
     def set_custom_workflow(self, workflow: Dict):
         """Set custom workflow JSON"""
         self.custom_workflow = workflow
+        self._custom_workflow_bytes = _dumps(workflow) if workflow else None
+        self._injection_plan = None
+
+    def _clone_custom_workflow(self) -> Dict:
+        """Fresh copy of the custom workflow, parsed from its cached serialized form"""
+        if self._custom_workflow_bytes is None:
+            self._custom_workflow_bytes = _dumps(self.custom_workflow)
+        return _loads(self._custom_workflow_bytes)
+
+    def _use_workflow_file(self, filepath: str):
+        """Set custom workflow from a file, reusing the file bytes as the serialized form"""
+        workflow, raw = self._read_workflow(filepath)
+        self.custom_workflow = workflow
+        self._custom_workflow_bytes = raw
+        self._injection_plan = None
 
     def load_workflow_from_file(self, filepath: str) -> Tuple[bool, str]:
         """Load workflow from JSON file"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                workflow = json.load(f)
-            self.custom_workflow = workflow
+            self._use_workflow_file(filepath)
             return True, "Workflow loaded successfully"
         except Exception as e:
             return False, f"Failed to load workflow: {str(e)}"
 
     def _prepare_txt2img_workflow(self, params: GenerationParams, model: str = "") -> Dict:
         """Prepare text-to-image workflow"""
-        workflow = json.loads(json.dumps(self.DEFAULT_TXT2IMG_WORKFLOW))
+        workflow = _loads(_TXT2IMG_TEMPLATE_BYTES)
 
         # Set parameters
-        workflow["3"]["inputs"]["seed"] = params.seed if params.seed >= 0 else int(time.time() * 1000) % (2**32)
-        workflow["3"]["inputs"]["steps"] = params.steps
-        workflow["3"]["inputs"]["cfg"] = params.cfg_scale
-        workflow["3"]["inputs"]["sampler_name"] = params.sampler
-        workflow["3"]["inputs"]["scheduler"] = params.scheduler
+        sampler = workflow["3"]["inputs"]
+        sampler["seed"] = _resolve_seed(params.seed)
+        sampler["steps"] = params.steps
+        sampler["cfg"] = params.cfg_scale
+        sampler["sampler_name"] = params.sampler
+        sampler["scheduler"] = params.scheduler
 
-        workflow["5"]["inputs"]["width"] = params.width
-        workflow["5"]["inputs"]["height"] = params.height
+        latent = workflow["5"]["inputs"]
+        latent["width"] = params.width
+        latent["height"] = params.height
 
         workflow["6"]["inputs"]["text"] = params.prompt
         workflow["7"]["inputs"]["text"] = params.negative_prompt
@@ -455,18 +730,19 @@ class ComfyUIClient:
 
     def _prepare_img2img_workflow(self, params: GenerationParams, uploaded_image: str, model: str = "") -> Dict:
         """Prepare image-to-image workflow"""
-        workflow = json.loads(json.dumps(self.DEFAULT_IMG2IMG_WORKFLOW))
+        workflow = _loads(_IMG2IMG_TEMPLATE_BYTES)
 
         # Set reference image
         workflow["1"]["inputs"]["image"] = uploaded_image
 
         # Set parameters
-        workflow["3"]["inputs"]["seed"] = params.seed if params.seed >= 0 else int(time.time() * 1000) % (2**32)
-        workflow["3"]["inputs"]["steps"] = params.steps
-        workflow["3"]["inputs"]["cfg"] = params.cfg_scale
-        workflow["3"]["inputs"]["sampler_name"] = params.sampler
-        workflow["3"]["inputs"]["scheduler"] = params.scheduler
-        workflow["3"]["inputs"]["denoise"] = params.denoise
+        sampler = workflow["3"]["inputs"]
+        sampler["seed"] = _resolve_seed(params.seed)
+        sampler["steps"] = params.steps
+        sampler["cfg"] = params.cfg_scale
+        sampler["sampler_name"] = params.sampler
+        sampler["scheduler"] = params.scheduler
+        sampler["denoise"] = params.denoise
 
         workflow["6"]["inputs"]["text"] = params.prompt
         workflow["7"]["inputs"]["text"] = params.negative_prompt
@@ -478,7 +754,35 @@ class ComfyUIClient:
 
         return workflow
 
-    def queue_prompt(self, workflow: Dict) -> Tuple[bool, str]:
+    def _parse_queue_response(self, status_code: int, data: Optional[Dict], text: str) -> Tuple[bool, str]:
+        """
+        Interpret a /prompt response
+        Returns: (success, prompt_id or error)
+        """
+        if status_code == 200:
+            result = data or {}
+            prompt_id = result.get('prompt_id', '')
+            if prompt_id:
+                return True, prompt_id
+            # Check for error in response
+            if 'error' in result:
+                return False, f"ComfyUI error: {result['error']}"
+            return True, prompt_id
+
+        # Parse error details from response
+        try:
+            error_msg = data.get('error', {}).get('message', text)
+            node_errors = data.get('node_errors', {})
+            if node_errors:
+                for node_id, node_error in node_errors.items():
+                    errors = node_error.get('errors', [])
+                    if errors:
+                        error_msg += f" | Node {node_id}: {errors[0].get('message', '')} - {errors[0].get('details', '')}"
+            return False, f"Queue failed: {error_msg}"
+        except:
+            return False, f"Queue failed: HTTP {status_code} - {text}"
+
+    def queue_prompt(self, workflow: Dict, client_id: Optional[str] = None) -> Tuple[bool, str]:
         """
         Queue a workflow for execution
         Returns: (success, prompt_id or error)
@@ -486,126 +790,94 @@ class ComfyUIClient:
         try:
             payload = {
                 "prompt": workflow,
-                "client_id": self.client_id
+                "client_id": client_id or self.client_id
             }
 
-            response = requests.post(
-                f"{self.config.base_url}/prompt",
+            response = self._session.post(
+                self._url_prompt,
                 json=payload,
                 timeout=30
             )
 
-            if response.status_code == 200:
-                result = response.json()
-                prompt_id = result.get('prompt_id', '')
-                if prompt_id:
-                    return True, prompt_id
-                # Check for error in response
-                if 'error' in result:
-                    return False, f"ComfyUI error: {result['error']}"
-                return True, prompt_id
-            else:
-                # Parse error details from response
-                try:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', {}).get('message', response.text)
-                    node_errors = error_data.get('node_errors', {})
-                    if node_errors:
-                        for node_id, node_error in node_errors.items():
-                            errors = node_error.get('errors', [])
-                            if errors:
-                                error_msg += f" | Node {node_id}: {errors[0].get('message', '')} - {errors[0].get('details', '')}"
-                    return False, f"Queue failed: {error_msg}"
-                except:
-                    return False, f"Queue failed: HTTP {response.status_code} - {response.text}"
+            try:
+                data = response.json()
+            except ValueError:
+                if response.status_code == 200:
+                    raise
+                data = None
+            return self._parse_queue_response(response.status_code, data, response.text)
         except Exception as e:
             return False, f"Queue error: {str(e)}"
 
+    @staticmethod
+    def _completion_result(state: '_WaitState') -> Tuple[bool, List[str]]:
+        """Build the wait_for_completion return value"""
+        if state.execution_error:
+            return False, [state.execution_error]
+
+        if not state.output_images:
+            return False, ["No output files generated"]
+
+        return True, state.output_images
+
     def wait_for_completion(
         self,
         prompt_id: str,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        client_id: Optional[str] = None
     ) -> Tuple[bool, List[str]]:
         """
         Wait for prompt completion using WebSocket
+        Pass the client_id the prompt was queued with, if not the client's own.
         Returns: (success, list of output image filenames or error messages)
         """
         try:
             ws = websocket.create_connection(
-                f"{self.config.ws_url}?clientId={self.client_id}",
+                self._url_ws_base + client_id if client_id else self._url_ws,
                 timeout=self.config.timeout
             )
 
-            output_images = []
-            execution_error = None
-
-            while True:
-                message = ws.recv()
-                if not message:
-                    continue
-
-                # Handle binary messages (preview images, etc.)
-                if isinstance(message, bytes):
-                    # Binary data - skip (usually preview images)
-                    continue
-
-                # Parse JSON message
-                try:
-                    data = json.loads(message)
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    # Skip malformed messages
-                    continue
-
-                msg_type = data.get('type', '')
-
-                if msg_type == 'progress':
-                    current = data['data'].get('value', 0)
-                    total = data['data'].get('max', 100)
-                    if progress_callback:
-                        progress_callback(current, total)
-
-                elif msg_type == 'executing':
-                    node = data['data'].get('node', '')
-                    if node is None:  # Execution finished
+            state = _WaitState(progress_callback)
+            finished = False
+
+            while not finished:
+                # Block for the next frame, then drain frames that are already readable
+                # so bursts of progress/executing messages are handled in one pass
+                # recv_data() hands back raw frame bytes, skipping the str decode of recv()
+                messages = [ws.recv_data()]
+                while select.select((ws.sock,), (), (), 0)[0]:
+                    messages.append(ws.recv_data())
+
+                for opcode, message in messages:
+                    if opcode != websocket.ABNF.OPCODE_TEXT:
+                        if opcode == websocket.ABNF.OPCODE_CLOSE:
+                            state.execution_error = state.execution_error or "WebSocket closed before completion"
+                            finished = True
+                            break
+                        # Binary data - skip (usually preview images)
+                        continue
+
+                    if not message:
+                        continue
+
+                    if progress_callback is None and message.startswith(_PROGRESS_PREFIXES):
+                        continue
+
+                    # Parse JSON message
+                    try:
+                        data = _loads(message)
+                    except (_JSONDecodeError, UnicodeDecodeError):
+                        # Skip malformed messages
+                        continue
+
+                    handler = _WS_HANDLERS.get(data.get('type'))
+                    if handler is not None and handler(data, state):
+                        finished = True
                         break
 
-                elif msg_type == 'executed':
-                    node_output = data['data'].get('output', {})
-                    # Handle images
-                    images = node_output.get('images', [])
-                    for img in images:
-                        output_images.append(img.get('filename', ''))
-                    # Handle videos (for video generation workflows)
-                    videos = node_output.get('videos', [])
-                    for vid in videos:
-                        output_images.append(vid.get('filename', ''))
-                    # Handle gifs
-                    gifs = node_output.get('gifs', [])
-                    for gif in gifs:
-                        output_images.append(gif.get('filename', ''))
-
-                elif msg_type == 'execution_error':
-                    # Capture execution errors
-                    error_data = data.get('data', {})
-                    execution_error = error_data.get('exception_message', 'Unknown execution error')
-                    node_id = error_data.get('node_id', 'unknown')
-                    node_type = error_data.get('node_type', 'unknown')
-                    execution_error = f"Node {node_id} ({node_type}): {execution_error}"
-                    break
-
-                elif msg_type == 'execution_cached':
-                    # Some nodes were cached, continue
-                    pass
-
             ws.close()
 
-            if execution_error:
-                return False, [execution_error]
-
-            if not output_images:
-                return False, ["No output files generated"]
-
-            return True, output_images
+            return self._completion_result(state)
 
         except websocket.WebSocketTimeoutException:
             return False, ["Timeout waiting for completion"]
@@ -620,8 +892,8 @@ class ComfyUIClient:
                 "subfolder": subfolder,
                 "type": folder_type
             }
-            response = requests.get(
-                f"{self.config.base_url}/view",
+            response = self._session.get(
+                self._url_view,
                 params=params,
                 timeout=30
             )
@@ -631,12 +903,113 @@ class ComfyUIClient:
         except:
             return None
 
+    def get_image_b64_bytes(self, filename: str, subfolder: str = "", folder_type: str = "output") -> Optional[bytes]:
+        """Download generated image as ASCII base64 bytes (single C-level encode pass)"""
+        image_data = self.get_image(filename, subfolder, folder_type)
+        if not image_data:
+            return None
+        return binascii.b2a_base64(image_data, newline=False)
+
+    def download_image_to(
+        self,
+        filename: str,
+        dst_path: str,
+        subfolder: str = "",
+        folder_type: str = "output"
+    ) -> bool:
+        """Stream generated image straight to dst_path without buffering it in memory"""
+        try:
+            params = {
+                "filename": filename,
+                "subfolder": subfolder,
+                "type": folder_type
+            }
+            with self._session.get(
+                self._url_view,
+                params=params,
+                stream=True,
+                timeout=30
+            ) as response:
+                if response.status_code != 200:
+                    return False
+                response.raw.decode_content = True
+                with open(dst_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, 1 << 20)
+            return True
+        except:
+            return False
+
+    def _copy_local_output(self, filename: str, subfolder: str, dst_path: str) -> bool:
+        """
+        Hardlink (or copy) an output file from a local ComfyUI output directory
+
+        The link/copy goes to a temporary name first and is then renamed over
+        dst_path, so an existing file is only replaced once the new one is complete.
+        Returns False when the file is not locally reachable, so callers fall back to /view.
+        """
+        if not self.config.has_local_output:
+            return False
+
+        src = os.path.join(self.config.output_dir, subfolder, filename)
+        if not os.path.isfile(src):
+            return False
+
+        try:
+            if os.path.exists(dst_path) and os.path.samefile(src, dst_path):
+                # Saving into ComfyUI's own output directory: the file is already there
+                return True
+        except OSError:
+            return False
+
+        tmp_path = f"{dst_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                # Cross-device link or filesystem without hardlinks
+                shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dst_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _save_outputs(self, output_files: List[str], output_dir: str, result: GenerationResult):
+        """Download output files into output_dir, or collect them as base64 if no dir given"""
+        if output_dir:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        def fetch(output_file: str) -> Optional[str]:
+            subfolder, _, filename = output_file.rpartition('/')
+            if output_dir:
+                save_path = os.path.join(output_dir, filename)
+                if self._copy_local_output(filename, subfolder, save_path):
+                    return save_path
+                return save_path if self.download_image_to(filename, save_path, subfolder) else None
+            # Return base64 if no output dir
+            image_b64 = self.get_image_b64_bytes(filename, subfolder)
+            return image_b64.decode('ascii') if image_b64 else None
+
+        filenames = [f for f in output_files if f]
+        if len(filenames) <= 1:
+            fetched = [fetch(f) for f in filenames]
+        else:
+            # Downloads are I/O bound; the pooled session keeps one socket per worker
+            with ThreadPoolExecutor(max_workers=min(4, len(filenames))) as executor:
+                fetched = list(executor.map(fetch, filenames))
+
+        result.images.extend(item for item in fetched if item)
+
     def text_to_image(
         self,
         params: GenerationParams,
         model: str = "",
         output_dir: str = "",
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        client_id: Optional[str] = None
     ) -> GenerationResult:
         """
         Generate image from text prompt
@@ -646,6 +1019,7 @@ class ComfyUIClient:
             model: Checkpoint model name (optional)
             output_dir: Directory to save output images
             progress_callback: Callback for progress updates
+            client_id: WebSocket client id for this job (defaults to the client's own)
 
         Returns:
             GenerationResult with success status and image paths
@@ -655,14 +1029,14 @@ class ComfyUIClient:
 
         # Use custom workflow if set
         if self.custom_workflow:
-            workflow = json.loads(json.dumps(self.custom_workflow))
-            # Try to inject parameters into custom workflow
-            self._inject_params_to_workflow(workflow, params)
+            workflow = self._clone_custom_workflow()
+            # Try to inject parameters into custom workflow (plan cached per workflow)
+            self._inject_params_to_workflow(workflow, params, self._custom_injection_plan())
         else:
             workflow = self._prepare_txt2img_workflow(params, model)
 
         # Queue the prompt
-        success, prompt_id = self.queue_prompt(workflow)
+        success, prompt_id = self.queue_prompt(workflow, client_id)
         if not success:
             result.error = prompt_id
             return result
@@ -670,27 +1044,13 @@ class ComfyUIClient:
         result.prompt_id = prompt_id
 
         # Wait for completion
-        success, output_files = self.wait_for_completion(prompt_id, progress_callback)
+        success, output_files = self.wait_for_completion(prompt_id, progress_callback, client_id)
         if not success:
             result.error = output_files[0] if output_files else "Unknown error"
             return result
 
         # Download and save images
-        if output_dir:
-            Path(output_dir).mkdir(parents=True, exist_ok=True)
-
-        for filename in output_files:
-            if filename:
-                image_data = self.get_image(filename)
-                if image_data:
-                    if output_dir:
-                        save_path = os.path.join(output_dir, filename)
-                        with open(save_path, 'wb') as f:
-                            f.write(image_data)
-                        result.images.append(save_path)
-                    else:
-                        # Return base64 if no output dir
-                        result.images.append(base64.b64encode(image_data).decode())
+        self._save_outputs(output_files, output_dir, result)
 
         result.success = len(result.images) > 0
         result.generation_time = time.time() - start_time
@@ -701,7 +1061,8 @@ class ComfyUIClient:
         params: GenerationParams,
         model: str = "",
         output_dir: str = "",
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        client_id: Optional[str] = None
     ) -> GenerationResult:
         """
         Generate image from reference image
@@ -711,6 +1072,7 @@ class ComfyUIClient:
             model: Checkpoint model name (optional)
             output_dir: Directory to save output images
             progress_callback: Callback for progress updates
+            client_id: WebSocket client id for this job (defaults to the client's own)
 
         Returns:
             GenerationResult with success status and image paths
@@ -732,7 +1094,7 @@ class ComfyUIClient:
         workflow = self._prepare_img2img_workflow(params, uploaded_name, model)
 
         # Queue the prompt
-        success, prompt_id = self.queue_prompt(workflow)
+        success, prompt_id = self.queue_prompt(workflow, client_id)
         if not success:
             result.error = prompt_id
             return result
@@ -740,90 +1102,94 @@ class ComfyUIClient:
         result.prompt_id = prompt_id
 
         # Wait for completion
-        success, output_files = self.wait_for_completion(prompt_id, progress_callback)
+        success, output_files = self.wait_for_completion(prompt_id, progress_callback, client_id)
         if not success:
             result.error = output_files[0] if output_files else "Unknown error"
             return result
 
         # Download and save images
-        if output_dir:
-            Path(output_dir).mkdir(parents=True, exist_ok=True)
-
-        for filename in output_files:
-            if filename:
-                image_data = self.get_image(filename)
-                if image_data:
-                    if output_dir:
-                        save_path = os.path.join(output_dir, filename)
-                        with open(save_path, 'wb') as f:
-                            f.write(image_data)
-                        result.images.append(save_path)
-                    else:
-                        result.images.append(base64.b64encode(image_data).decode())
+        self._save_outputs(output_files, output_dir, result)
 
         result.success = len(result.images) > 0
         result.generation_time = time.time() - start_time
         return result
 
-    def _inject_params_to_workflow(self, workflow: Dict, params: GenerationParams):
-        """Try to inject parameters into custom workflow"""
-        prompt_injected = False
+    def generate_batch(
+        self,
+        params_list: List[GenerationParams],
+        model: str = "",
+        output_dir: str = "",
+        max_in_flight: Optional[int] = None,
+        on_start: Optional[Callable[[int], None]] = None
+    ) -> List[GenerationResult]:
+        """
+        Generate several images with overlapping server round trips
+
+        Params with ref_image_path go through image-to-image, the rest through
+        text-to-image. Jobs run on a thread pool, and each one queues and
+        listens with its own client_id so completion messages of concurrent
+        jobs never mix. Results are in params_list order.
 
-        for node_id, node in workflow.items():
-            class_type = node.get('class_type', '')
-            inputs = node.get('inputs', {})
-
-            # Inject prompt - PrimitiveStringMultiline (Z-Image style)
-            if class_type == 'PrimitiveStringMultiline':
-                if 'value' in inputs:
-                    inputs['value'] = params.prompt
-                    prompt_injected = True
-
-            # Inject prompt - CLIPTextEncode (standard style)
-            elif class_type == 'CLIPTextEncode':
-                if 'text' in inputs:
-                    # Only inject if it's a string (not a connection)
-                    if isinstance(inputs['text'], str):
-                        if inputs['text'] == '' or inputs['text'] == 'positive':
-                            inputs['text'] = params.prompt
-                            prompt_injected = True
-                        elif inputs['text'] == 'negative':
-                            inputs['text'] = params.negative_prompt
-
-            # Inject dimensions - EmptyLatentImage (standard)
-            elif class_type == 'EmptyLatentImage':
-                if 'width' in inputs:
-                    inputs['width'] = params.width
-                if 'height' in inputs:
-                    inputs['height'] = params.height
-
-            # Inject dimensions - EmptySD3LatentImage (SD3/Z-Image style)
-            elif class_type == 'EmptySD3LatentImage':
-                if 'width' in inputs:
-                    inputs['width'] = params.width
-                if 'height' in inputs:
-                    inputs['height'] = params.height
-
-            # Inject sampler settings - KSampler
-            elif class_type == 'KSampler':
-                if 'seed' in inputs:
-                    inputs['seed'] = params.seed if params.seed >= 0 else int(time.time() * 1000) % (2**32)
-                # Note: Don't override steps/cfg if using custom workflow
-                # as they may be tuned specifically for that workflow
-
-            # Inject reference image - LoadImage
-            elif class_type == 'LoadImage':
-                if params.ref_image_path and 'image' in inputs:
-                    # Need to upload and set the image name
-                    pass  # Handled separately in image_to_image
+        Args:
+            max_in_flight: Cap on concurrently submitted jobs. The GPU renders
+                one prompt at a time anyway, so a small window (e.g. 3) already
+                overlaps upload/queueing of the next job and download of the
+                previous one with the current render. None submits everything.
+            on_start: Called with the job index when a job starts
+        """
+        if not params_list:
+            return []
+
+        def run(i: int) -> GenerationResult:
+            if on_start:
+                on_start(i)
+            p = params_list[i]
+            client_id = str(uuid.uuid4())
+            if p.ref_image_path:
+                return self.image_to_image(p, model, output_dir, client_id=client_id)
+            return self.text_to_image(p, model, output_dir, client_id=client_id)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight or len(params_list)) as executor:
+            return list(executor.map(run, range(len(params_list))))
+
+    def _custom_injection_plan(self) -> List[Tuple[str, Callable]]:
+        """Injection plan for the current custom workflow, rebuilt only when it changes"""
+        key = id(self.custom_workflow)
+        if self._injection_plan is None or self._injection_plan[0] != key:
+            self._injection_plan = (key, _build_injection_plan(self.custom_workflow))
+        return self._injection_plan[1]
+
+    def _inject_params_to_workflow(
+        self,
+        workflow: Dict,
+        params: GenerationParams,
+        plan: Optional[List[Tuple[str, Callable]]] = None
+    ) -> bool:
+        """
+        Try to inject parameters into custom workflow
+
+        Args:
+            workflow: Workflow dict to modify in place
+            params: Generation parameters
+            plan: Precomputed (node_id, injector) pairs; built from workflow if omitted
+        """
+        if plan is None:
+            plan = _build_injection_plan(workflow)
+
+        seed = _resolve_seed(params.seed)
+        prompt_injected = False
+        for node_id, injector in plan:
+            inputs = workflow[node_id].get('inputs', {})
+            if injector(inputs, params, seed):
+                prompt_injected = True
 
         return prompt_injected
 
     def interrupt(self) -> bool:
         """Interrupt current generation"""
         try:
-            response = requests.post(
-                f"{self.config.base_url}/interrupt",
+            response = self._session.post(
+                self._url_interrupt,
                 timeout=5
             )
             return response.status_code == 200
@@ -833,8 +1199,8 @@ class ComfyUIClient:
     def get_queue_status(self) -> Dict:
         """Get current queue status"""
         try:
-            response = requests.get(
-                f"{self.config.base_url}/queue",
+            response = self._session.get(
+                self._url_queue,
                 timeout=5
             )
             if response.status_code == 200:
@@ -844,6 +1210,11 @@ class ComfyUIClient:
             return {}
 
 
+# Default workflows serialized once; parsing these is cheaper than a dumps+loads clone per call
+_TXT2IMG_TEMPLATE_BYTES = json.dumps(ComfyUIClient.DEFAULT_TXT2IMG_WORKFLOW).encode('utf-8')
+_IMG2IMG_TEMPLATE_BYTES = json.dumps(ComfyUIClient.DEFAULT_IMG2IMG_WORKFLOW).encode('utf-8')
+
+
 # Helper functions
 def create_comfyui_client(host: str = "127.0.0.1", port: int = 8188, workflow_dir: str = None) -> ComfyUIClient:
     """Create ComfyUI client with specified host and port"""
@@ -5,38 +5,58 @@ AI Storyboard Pro v2.2 - 配置兼容层
 新代码应从 settings.py 导入。
 """
 
+from types import MappingProxyType
+
 from settings import settings, get_settings
 
 # =============================================
-# API 配置 - 苍何 API (新)
+# 延迟解析的配置项
 # =============================================
-CANGHE_API_KEY = settings.api_key
-CANGHE_API_BASE_URL = settings.api_base_url
+# API / 路径 / 服务器配置在首次访问时才从 settings 读取,
+# 导入本模块不会触发任何磁盘 I/O
+_LAZY_ATTRS = {
+    # API 配置 - 苍何 API (新)
+    "CANGHE_API_KEY": lambda: settings.api_key,
+    "CANGHE_API_BASE_URL": lambda: settings.api_base_url,
+    # 向后兼容别名 (旧代码可能使用这些名称)
+    "NANA_BANANA_API_KEY": lambda: settings.api_key,  # 已弃用，使用 CANGHE_API_KEY
+    "NANA_BANANA_BASE_URL": lambda: settings.api_base_url,  # 已弃用
+    # 路径配置
+    "BASE_DIR": lambda: settings.base_dir,
+    "ASSETS_DIR": lambda: settings.assets_dir,
+    "PROJECTS_DIR": lambda: settings.projects_dir,
+    "OUTPUTS_DIR": lambda: settings.outputs_dir,
+    # 服务器配置
+    "SERVER_HOST": lambda: settings.gradio_host,
+    "SERVER_PORT": lambda: settings.gradio_port,
+    # 图像生成后端
+    "IMAGE_BACKEND": lambda: settings.image_backend,  # "canghe" 或 "comfyui"
+}
 
-# 向后兼容别名 (旧代码可能使用这些名称)
-NANA_BANANA_API_KEY = settings.api_key  # 已弃用，使用 CANGHE_API_KEY
-NANA_BANANA_BASE_URL = settings.api_base_url  # 已弃用
+# 首次访问路径时才创建目录
+_PATH_ATTRS = frozenset({"BASE_DIR", "ASSETS_DIR", "PROJECTS_DIR", "OUTPUTS_DIR"})
+_dirs_ready = False
+
+
+def __getattr__(name: str):
+    """模块级属性延迟解析 (PEP 562)"""
+    global _dirs_ready
+    resolver = _LAZY_ATTRS.get(name)
+    if resolver is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in _PATH_ATTRS and not _dirs_ready:
+        settings.ensure_directories()
+        _dirs_ready = True
+    return resolver()
 
-# =============================================
-# 路径配置
-# =============================================
-BASE_DIR = settings.base_dir
-ASSETS_DIR = settings.assets_dir
-PROJECTS_DIR = settings.projects_dir
-OUTPUTS_DIR = settings.outputs_dir
 
-# 确保目录存在
-settings.ensure_directories()
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
 
 # 资产子目录
 ASSETS_SUBDIRS = ["characters", "scenes", "props", "styles"]
 
-# =============================================
-# 服务器配置
-# =============================================
-SERVER_HOST = settings.gradio_host
-SERVER_PORT = settings.gradio_port
-
 # =============================================
 # 图像生成默认值
 # =============================================
@@ -105,7 +125,6 @@ STYLE_PRESETS = {
     }
 }
 
-# =============================================
-# 图像生成后端
-# =============================================
-IMAGE_BACKEND = settings.image_backend  # "canghe" 或 "comfyui"
+# 预设表只读, 需要可变副本时使用 dict(STYLE_PRESETS[name])
+ASPECT_RATIOS = MappingProxyType(ASPECT_RATIOS)
+STYLE_PRESETS = MappingProxyType({k: MappingProxyType(v) for k, v in STYLE_PRESETS.items()})
@@ -3,9 +3,139 @@ Gradio 适配层 - 连接 Gradio UI 与服务层
 支持未来迁移到其他前端框架
 """
 
+import threading
+from collections import OrderedDict
 from typing import List, Tuple, Dict, Any, Optional
+import httpx
+import gradio as gr
+from jinja2 import Environment, BaseLoader
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
 from services import services, Config, EXAMPLE_STORIES
 from templates import get_template_choices_cn, TEMPLATE_QUICK_REF
+from upload_utils import save_uploaded_image, save_multiple_images
+
+
+# ========================================
+# HTML 模板 (导入时编译一次, 自动转义用户输入)
+# ========================================
+
+_env = Environment(loader=BaseLoader(), autoescape=True)
+
+_CHARACTER_TMPL = _env.from_string("""
+{%- for item_id, name, summary in rows %}
+        <div style='background: #f5f5f7; padding: 12px; border-radius: 8px; margin: 8px 0;'>
+            <strong>{{ name }}</strong>
+            <p style='color: #666; margin: 4px 0; font-size: 13px;'>{{ summary }}</p>
+            <button onclick='delete_char("{{ item_id }}")' style='font-size: 12px; color: #ff3b30;'>删除</button>
+        </div>
+{%- endfor %}
+""")
+
+_SCENE_TMPL = _env.from_string("""
+{%- for item_id, name, summary in rows %}
+        <div style='background: #f5f5f7; padding: 12px; border-radius: 8px; margin: 8px 0;'>
+            <strong>{{ name }}</strong>
+            <p style='color: #666; margin: 4px 0; font-size: 13px;'>{{ summary }}</p>
+            <button onclick='delete_scene("{{ item_id }}")' style='font-size: 12px; color: #ff3b30;'>删除</button>
+        </div>
+{%- endfor %}
+""")
+
+# 镜头状态 -> (颜色, 文字); 未列出的状态按待生成显示
+_SHOT_STATUS = {"completed": ("#34c759", "已生成")}
+_SHOT_STATUS_DEFAULT = ("#ff9500", "待生成")
+
+_SHOT_TMPL = _env.from_string("""
+<div style="display: flex; flex-direction: column; gap: 12px;">
+{%- for number, template, status, description, scene, characters in rows %}
+{%- set status_color, status_text = shot_status.get(status, shot_status_default) %}
+        <div style='background: white; padding: 16px; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.06);'>
+            <div style='display: flex; justify-content: space-between; align-items: center;'>
+                <div>
+                    <span style='font-size: 18px; font-weight: 600;'>镜头 {{ number }}</span>
+                    <span style='background: #e8e8ed; padding: 4px 12px; border-radius: 4px; margin-left: 8px; font-size: 12px;'>{{ template }}</span>
+                    <span style='color: {{ status_color }}; font-size: 12px; margin-left: 8px;'>● {{ status_text }}</span>
+                </div>
+                <div>
+                    <button onclick='move_shot_up({{ number }})' style='padding: 4px 8px;'>↑</button>
+                    <button onclick='move_shot_down({{ number }})' style='padding: 4px 8px;'>↓</button>
+                    <button onclick='delete_shot({{ number }})' style='padding: 4px 8px; color: #ff3b30;'>×</button>
+                </div>
+            </div>
+            <p style='color: #666; margin: 8px 0; font-size: 14px;'>{{ description }}</p>
+            <div style='font-size: 12px; color: #888;'>
+                场景: {{ scene }} | 角色: {{ characters }}
+            </div>
+        </div>
+{%- endfor %}
+</div>
+""", globals={"shot_status": _SHOT_STATUS, "shot_status_default": _SHOT_STATUS_DEFAULT})
+
+_EXAMPLES_TMPL = _env.from_string("""
+<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 16px;">
+{%- for e in examples %}
+        <div class='example-card' onclick='load_example("{{ e.name }}")'>
+            <h4 style='margin: 0 0 8px 0;'>{{ e.name }}</h4>
+            <p style='color: #666; font-size: 13px; margin: 0;'>{{ e.description }}</p>
+            <div style='margin-top: 12px; font-size: 12px; color: #888;'>
+                角色: {{ e.character_count }} | 场景: {{ e.scene_count }} | 镜头: {{ e.shot_count }}
+            </div>
+        </div>
+{%- endfor %}
+</div>
+""")
+
+_TEMPLATE_GUIDE_TMPL = _env.from_string("""
+<div style="background: #f5f5f7; padding: 16px; border-radius: 12px;">
+<h4 style="margin: 0 0 12px 0;">镜头类型参考</h4>
+{%- for template_cn, info in templates %}
+        <div style='margin: 8px 0; padding: 8px; background: white; border-radius: 8px;'>
+            <strong>{{ template_cn }}</strong>
+            <span style='color: #666; font-size: 13px; margin-left: 8px;'>{{ info.use }}</span>
+        </div>
+{%- endfor %}
+</div>
+""")
+
+
+# ========================================
+# 渲染缓存
+# ========================================
+
+# 类型 -> (数据版本, 渲染结果); 数据未变化时直接复用上次渲染结果 (HTML 或下拉选项)
+_render_cache: Dict[str, Tuple[Any, Any]] = {}
+
+
+def _summarize(text: str, limit: int = 50) -> str:
+    """截取列表卡片中显示的描述摘要"""
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _cached(kind: str, version: Any, build):
+    """按数据版本缓存渲染结果, 版本变化时重新构建"""
+    cached = _render_cache.get(kind)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = build()
+    _render_cache[kind] = (version, value)
+    return value
 
 
 # ========================================
@@ -23,17 +153,24 @@ def create_project(name: str, ratio: str) -> Tuple[str, bool]:
 
 def get_project_summary() -> str:
     """获取项目摘要"""
+    return _cached("summary", services.project.version, _build_project_summary)
+
+
+def _build_project_summary() -> str:
     info = services.project.get_project_info()
     if not info:
         return "尚未创建项目"
 
     stats = info['stats']
+    character_count, scene_count, shot_count, completed_count = (
+        stats['character_count'], stats['scene_count'], stats['shot_count'], stats['completed_count']
+    )
     return f"""
 ### {info['name']}
 
-**角色**: {stats['character_count']} 个  |  **场景**: {stats['scene_count']} 个  |  **镜头**: {stats['shot_count']} 个
+**角色**: {character_count} 个  |  **场景**: {scene_count} 个  |  **镜头**: {shot_count} 个
 
-**已生成**: {stats['completed_count']}/{stats['shot_count']} 个镜头
+**已生成**: {completed_count}/{shot_count} 个镜头
 """
 
 
@@ -52,7 +189,6 @@ def add_character(name: str, description: str, ref_images: List = None) -> Tuple
     # 保存上传的图片
     ref_paths = []
     if ref_images:
-        from app import save_multiple_images
         ref_paths = save_multiple_images(ref_images, "characters", name)
 
     result = services.character.add_character(name, description, ref_paths)
@@ -71,26 +207,25 @@ def delete_character(character_id: str) -> Tuple[str, str]:
 
 def format_character_list() -> str:
     """格式化角色列表为HTML"""
+    return _cached("characters", services.character.version, _build_character_list)
+
+
+def _build_character_list() -> str:
     chars = services.character.list_characters()
     if not chars:
         return "<p style='color: #666;'>暂无角色</p>"
 
-    html = ""
-    for c in chars:
-        html += f"""
-        <div style='background: #f5f5f7; padding: 12px; border-radius: 8px; margin: 8px 0;'>
-            <strong>{c['name']}</strong>
-            <p style='color: #666; margin: 4px 0; font-size: 13px;'>{c['description'][:50]}...</p>
-            <button onclick='delete_char("{c["id"]}")' style='font-size: 12px; color: #ff3b30;'>删除</button>
-        </div>
-        """
-    return html
+    rows = [(c['id'], c['name'], _summarize(c['description'])) for c in chars]
+    return _CHARACTER_TMPL.render(rows=rows)
 
 
 def get_character_choices() -> List[Tuple[str, str]]:
     """获取角色选择列表"""
-    chars = services.character.list_characters()
-    return [(c['name'], c['id']) for c in chars]
+    return _cached("character_choices", services.character.version, _build_character_choices)
+
+
+def _build_character_choices() -> List[Tuple[str, str]]:
+    return [(c['name'], c['id']) for c in services.character.list_characters()]
 
 
 # ========================================
@@ -101,7 +236,6 @@ def add_scene(name: str, description: str, ref_image=None) -> Tuple[str, str, st
     """添加场景"""
     ref_path = ""
     if ref_image:
-        from app import save_uploaded_image
         ref_path = save_uploaded_image(ref_image, "scenes", name)
 
     result = services.scene.add_scene(name, description, ref_path)
@@ -119,26 +253,25 @@ def delete_scene(scene_id: str) -> Tuple[str, str]:
 
 def format_scene_list() -> str:
     """格式化场景列表为HTML"""
+    return _cached("scenes", services.scene.version, _build_scene_list)
+
+
+def _build_scene_list() -> str:
     scenes = services.scene.list_scenes()
     if not scenes:
         return "<p style='color: #666;'>暂无场景</p>"
 
-    html = ""
-    for s in scenes:
-        html += f"""
-        <div style='background: #f5f5f7; padding: 12px; border-radius: 8px; margin: 8px 0;'>
-            <strong>{s['name']}</strong>
-            <p style='color: #666; margin: 4px 0; font-size: 13px;'>{s['description'][:50]}...</p>
-            <button onclick='delete_scene("{s["id"]}")' style='font-size: 12px; color: #ff3b30;'>删除</button>
-        </div>
-        """
-    return html
+    rows = [(s['id'], s['name'], _summarize(s['description'])) for s in scenes]
+    return _SCENE_TMPL.render(rows=rows)
 
 
 def get_scene_choices() -> List[Tuple[str, str]]:
     """获取场景选择列表"""
-    scenes = services.scene.list_scenes()
-    return [(s['name'], s['id']) for s in scenes]
+    return _cached("scene_choices", services.scene.version, _build_scene_choices)
+
+
+def _build_scene_choices() -> List[Tuple[str, str]]:
+    return [(s['name'], s['id']) for s in services.scene.list_scenes()]
 
 
 # ========================================
@@ -170,39 +303,22 @@ def move_shot(shot_number: int, direction: str) -> Tuple[str, str]:
 
 def format_shot_list() -> str:
     """格式化镜头列表为HTML"""
-    shots = services.shot.list_shots()
-    if not shots:
-        return "<p style='color: #666;'>暂无镜头</p>"
+    return _cached("shots", _shot_list_version(), _build_shot_list)
 
-    html = '<div style="display: flex; flex-direction: column; gap: 12px;">'
-    for s in shots:
-        status_color = "#34c759" if s['status'] == 'completed' else "#ff9500"
-        status_text = "已生成" if s['status'] == 'completed' else "待生成"
 
-        char_str = ", ".join(s['characters']) if s['characters'] else "无角色"
+def _shot_list_version() -> Tuple[int, int, int]:
+    # 镜头卡片显示角色名和场景名, 因此角色/场景变化也需要重建
+    return (services.character.version, services.scene.version, services.shot.version)
 
-        html += f"""
-        <div style='background: white; padding: 16px; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.06);'>
-            <div style='display: flex; justify-content: space-between; align-items: center;'>
-                <div>
-                    <span style='font-size: 18px; font-weight: 600;'>镜头 {s['shot_number']}</span>
-                    <span style='background: #e8e8ed; padding: 4px 12px; border-radius: 4px; margin-left: 8px; font-size: 12px;'>{s['template']}</span>
-                    <span style='color: {status_color}; font-size: 12px; margin-left: 8px;'>● {status_text}</span>
-                </div>
-                <div>
-                    <button onclick='move_shot_up({s["shot_number"]})' style='padding: 4px 8px;'>↑</button>
-                    <button onclick='move_shot_down({s["shot_number"]})' style='padding: 4px 8px;'>↓</button>
-                    <button onclick='delete_shot({s["shot_number"]})' style='padding: 4px 8px; color: #ff3b30;'>×</button>
-                </div>
-            </div>
-            <p style='color: #666; margin: 8px 0; font-size: 14px;'>{s['description']}</p>
-            <div style='font-size: 12px; color: #888;'>
-                场景: {s['scene']} | 角色: {char_str}
-            </div>
-        </div>
-        """
-    html += '</div>'
-    return html
+
+def _build_shot_list() -> str:
+    soa = services.shot.list_shots_soa()
+    if not soa["numbers"]:
+        return "<p style='color: #666;'>暂无镜头</p>"
+
+    rows = zip(soa["numbers"], soa["templates"], soa["statuses"],
+               soa["descriptions"], soa["scenes"], soa["characters_display"])
+    return _SHOT_TMPL.render(rows=rows)
 
 
 # ========================================
@@ -276,21 +392,14 @@ def export_project(format_type: str) -> Tuple[str, Optional[str]]:
 
 def get_example_stories_html() -> str:
     """获取示例故事HTML卡片"""
+    # 示例故事为静态常量, 只需构建一次
+    return _cached("examples", None, _build_example_stories)
+
+
+def _build_example_stories() -> str:
     examples = services.get_example_stories()
 
-    html = '<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 16px;">'
-    for e in examples:
-        html += f"""
-        <div class='example-card' onclick='load_example("{e["name"]}")'>
-            <h4 style='margin: 0 0 8px 0;'>{e['name']}</h4>
-            <p style='color: #666; font-size: 13px; margin: 0;'>{e['description']}</p>
-            <div style='margin-top: 12px; font-size: 12px; color: #888;'>
-                角色: {e['character_count']} | 场景: {e['scene_count']} | 镜头: {e['shot_count']}
-            </div>
-        </div>
-        """
-    html += '</div>'
-    return html
+    return _EXAMPLES_TMPL.render(examples=examples)
 
 
 def load_example_story(story_name: str) -> Tuple[str, str, str, str, str]:
@@ -313,37 +422,67 @@ def load_example_story(story_name: str) -> Tuple[str, str, str, str, str]:
 # UI 数据刷新适配
 # ========================================
 
-def refresh_all_ui() -> Tuple[str, str, str, str]:
-    """刷新所有UI组件"""
-    return (
-        get_project_summary(),
-        format_character_list(),
-        format_scene_list(),
-        format_shot_list()
+# Gradio 会话 -> (组件 -> 该会话上次 refresh_all_ui 返回时的数据版本), 只保留最近活跃的会话
+_refresh_versions_by_session: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_refresh_versions_lock = threading.Lock()
+_MAX_REFRESH_SESSIONS = 256
+
+
+def refresh_all_ui(request: Optional[gr.Request] = None) -> Tuple[Any, Any, Any, Any]:
+    """
+    刷新所有UI组件, 数据未变化的组件返回空更新以免重复传输 HTML
+
+    已渲染的数据版本按 Gradio 会话分别记录 (request 由 Gradio 自动注入),
+    新会话或页面刷新后总是完整渲染; 在 Gradio 之外调用 (无 request) 时也完整渲染
+    """
+    components = (
+        ("summary", services.project.version, get_project_summary),
+        ("characters", services.character.version, format_character_list),
+        ("scenes", services.scene.version, format_scene_list),
+        ("shots", _shot_list_version(), format_shot_list),
     )
 
+    session = getattr(request, "session_hash", None)
+    last_versions: Dict[str, Any] = {}
+    if session:
+        with _refresh_versions_lock:
+            last_versions = _refresh_versions_by_session.get(session, last_versions)
+
+    updates = []
+    versions = {}
+    for kind, version, render in components:
+        versions[kind] = version
+        if kind in last_versions and last_versions[kind] == version:
+            updates.append(gr.update())
+        else:
+            updates.append(render())
+
+    if session:
+        with _refresh_versions_lock:
+            _refresh_versions_by_session[session] = versions
+            _refresh_versions_by_session.move_to_end(session)
+            while len(_refresh_versions_by_session) > _MAX_REFRESH_SESSIONS:
+                _refresh_versions_by_session.popitem(last=False)
+    return tuple(updates)
+
 
 def get_template_guide() -> str:
     """获取镜头类型指南HTML"""
-    html = '<div style="background: #f5f5f7; padding: 16px; border-radius: 12px;">'
-    html += '<h4 style="margin: 0 0 12px 0;">镜头类型参考</h4>'
+    # 模板定义在运行时不会变化, 只需构建一次
+    return _cached("template_guide", None, _build_template_guide)
 
-    for template_cn, info in TEMPLATE_QUICK_REF.items():
-        html += f"""
-        <div style='margin: 8px 0; padding: 8px; background: white; border-radius: 8px;'>
-            <strong>{template_cn}</strong>
-            <span style='color: #666; font-size: 13px; margin-left: 8px;'>{info['use']}</span>
-        </div>
-        """
 
-    html += '</div>'
-    return html
+def _build_template_guide() -> str:
+    return _TEMPLATE_GUIDE_TMPL.render(templates=TEMPLATE_QUICK_REF.items())
 
 
 # ========================================
 # API 客户端适配 (用于未来前端)
 # ========================================
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
 class APIClient:
     """
     API 客户端 - 用于前端调用后端 API
@@ -352,89 +491,79 @@ class APIClient:
 
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        """共享的 httpx.AsyncClient, 首次使用时创建, 各请求复用 keep-alive 连接"""
+        if self._client is None:
+            # 安装 h2 时启用 HTTP/2, 并发请求在同一连接上多路复用
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=_HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+            )
+        return self._client
+
+    async def _post(self, path: str, payload: Dict) -> Dict:
+        """POST JSON 请求体, 使用 orjson (如可用) 完成序列化与解析"""
+        response = await self.client.post(path, content=_dumps(payload), headers=_JSON_HEADERS)
+        return _loads(response.content)
+
+    async def _get(self, path: str) -> Dict:
+        response = await self.client.get(path)
+        return _loads(response.content)
+
+    async def aclose(self):
+        """关闭底层连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
 
     async def create_project(self, name: str, aspect_ratio: str = "16:9") -> Dict:
         """创建项目 - 调用 POST /api/project"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/project",
-                json={"name": name, "aspect_ratio": aspect_ratio}
-            )
-            return response.json()
+        return await self._post("/api/project", {"name": name, "aspect_ratio": aspect_ratio})
 
     async def get_project(self) -> Dict:
         """获取项目 - 调用 GET /api/project"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/api/project")
-            return response.json()
+        return await self._get("/api/project")
 
     async def add_character(self, name: str, description: str) -> Dict:
         """添加角色 - 调用 POST /api/characters"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/characters",
-                json={"name": name, "description": description}
-            )
-            return response.json()
+        return await self._post("/api/characters", {"name": name, "description": description})
 
     async def add_scene(self, name: str, description: str) -> Dict:
         """添加场景 - 调用 POST /api/scenes"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/scenes",
-                json={"name": name, "description": description}
-            )
-            return response.json()
+        return await self._post("/api/scenes", {"name": name, "description": description})
 
     async def add_shot(self, template: str, description: str,
                        character_ids: List[str] = None, scene_id: str = "") -> Dict:
         """添加镜头 - 调用 POST /api/shots"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/shots",
-                json={
-                    "template": template,
-                    "description": description,
-                    "character_ids": character_ids or [],
-                    "scene_id": scene_id
-                }
-            )
-            return response.json()
+        return await self._post("/api/shots", {
+            "template": template,
+            "description": description,
+            "character_ids": character_ids or [],
+            "scene_id": scene_id
+        })
 
     async def generate_shot(self, shot_number: int, custom_prompt: str = "") -> Dict:
         """生成镜头 - 调用 POST /api/generate/shot"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/generate/shot",
-                json={"shot_number": shot_number, "custom_prompt": custom_prompt}
-            )
-            return response.json()
+        return await self._post("/api/generate/shot", {"shot_number": shot_number, "custom_prompt": custom_prompt})
 
     async def export_project(self, format_type: str = "json") -> Dict:
         """导出项目 - 调用 POST /api/export"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/export",
-                json={"format": format_type}
-            )
-            return response.json()
+        return await self._post("/api/export", {"format": format_type})
 
     async def load_example(self, story_name: str) -> Dict:
         """加载示例 - 调用 POST /api/examples/load"""
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/examples/load",
-                json={"story_name": story_name}
-            )
-            return response.json()
+        return await self._post("/api/examples/load", {"story_name": story_name})
 
 
 # 用于快速测试
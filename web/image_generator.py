@@ -8,16 +8,32 @@ AI Storyboard Pro - Image Generator v2.2
 """
 
 import os
+import re
+import sys
+import json
 import time
 import asyncio
+import binascii
+import functools
+import itertools
+import threading
 import httpx
 from pathlib import Path
 from typing import List, Optional, Dict, Any, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from types import MappingProxyType
 
-from models import Shot, StoryboardProject, Character, Scene
+from models import Shot, StoryboardProject, Character, Scene, ShotTemplate
+from prompt_generator import generate_negative_prompt
+from templates import get_template
+
+try:
+    from comfyui_client import GenerationParams, create_comfyui_client_from_settings
+    HAS_COMFYUI = True
+except ImportError:
+    HAS_COMFYUI = False
 
 
 # ============================================
@@ -73,14 +89,45 @@ class JimengStatus(str, Enum):
 _current_canghe_model = CangheImageModel.NANO_BANANA  # 即梦仅支持视频，图像使用 nano-banana
 _canghe_api_key = ""
 
+# 宽高比 -> 像素尺寸 (两个生成器共用, 只读)
+_ASPECT_RATIOS = MappingProxyType({
+    "16:9": (1024, 576),
+    "9:16": (576, 1024),
+    "1:1": (768, 768),
+    "4:3": (896, 672),
+    "3:4": (672, 896),
+    "21:9": (1024, 440)
+})
+_DEFAULT_DIMENSIONS = (1024, 576)
+
+# 宽高比 -> DALL-E 3 支持的尺寸
+_DALLE_SIZES = MappingProxyType({
+    "16:9": "1792x1024",
+    "9:16": "1024x1792",
+    "1:1": "1024x1024",
+    "4:3": "1024x1024",
+    "3:4": "1024x1024",
+})
+
+# 即梦支持的宽高比
+_JIMENG_RATIOS = frozenset({"16:9", "9:16", "1:1", "4:3", "3:4", "21:9"})
+
+
+@functools.lru_cache(maxsize=64)
+def _negative_prompt_for(template_type: ShotTemplate, fallback: str = "") -> str:
+    """模板对应的负提示词 (同一模板的镜头共享结果)"""
+    template = get_template(template_type)
+    return generate_negative_prompt(template) if template else fallback
+
+
+# 替换 Windows 非法字符: \ / : * ? " < > |
+# 同时替换中文冒号、全角字符等
+_ILLEGAL_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|：；]')
+
 
 def sanitize_filename(name: str) -> str:
     """清理文件名中的非法字符"""
-    import re
-    # 替换 Windows 非法字符: \ / : * ? " < > |
-    # 同时替换中文冒号、全角字符等
-    illegal_chars = r'[\\/:*?"<>|：；]'
-    sanitized = re.sub(illegal_chars, '_', name)
+    sanitized = _ILLEGAL_FILENAME_CHARS.sub('_', name)
     # 去除首尾空格和点
     sanitized = sanitized.strip(' .')
     return sanitized or "unnamed"
@@ -123,6 +170,68 @@ def get_canghe_model() -> CangheImageModel:
     return _current_canghe_model
 
 
+class _RefIndex:
+    """
+    项目参考图索引
+
+    按 id 一次性索引角色/场景/道具 (替代 get_*_by_id 的线性查找),
+    并按需缓存每个实体的有效参考图 [(路径, 基础权重)], 同一批次内只解析一次
+    """
+
+    def __init__(self, project: StoryboardProject, exists):
+        self.project = project
+        self._exists = exists
+        self._characters = {c.id: c for c in project.characters}
+        self._scenes = {s.id: s for s in project.scenes}
+        self._props = {p.id: p for p in project.props}
+        self._char_refs: Dict[str, List[Tuple[str, float]]] = {}
+        self._scene_refs: Dict[str, List[Tuple[str, float]]] = {}
+        self._prop_refs: Dict[str, List[Tuple[str, float]]] = {}
+        self._style_refs: Optional[List[Tuple[str, float]]] = None
+
+    def character_refs(self, char_id: str) -> List[Tuple[str, float]]:
+        refs = self._char_refs.get(char_id)
+        if refs is None:
+            char = self._characters.get(char_id)
+            refs = []
+            if char and char.ref_images:
+                refs = [(ref_img, char.consistency_weight)
+                        for ref_img in char.ref_images[:2] if self._exists(ref_img)]
+            self._char_refs[char_id] = refs
+        return refs
+
+    def scene_refs(self, scene_id: str) -> List[Tuple[str, float]]:
+        refs = self._scene_refs.get(scene_id)
+        if refs is None:
+            scene = self._scenes.get(scene_id)
+            refs = []
+            if scene:
+                if scene.space_ref_image and self._exists(scene.space_ref_image):
+                    refs.append((scene.space_ref_image, scene.consistency_weight))
+                if scene.atmosphere_ref_image and self._exists(scene.atmosphere_ref_image):
+                    refs.append((scene.atmosphere_ref_image, 0.5))
+            self._scene_refs[scene_id] = refs
+        return refs
+
+    def prop_refs(self, prop_id: str) -> List[Tuple[str, float]]:
+        refs = self._prop_refs.get(prop_id)
+        if refs is None:
+            prop = self._props.get(prop_id)
+            refs = []
+            if prop and prop.ref_image and self._exists(prop.ref_image):
+                refs.append((prop.ref_image, prop.consistency_weight))
+            self._prop_refs[prop_id] = refs
+        return refs
+
+    def style_refs(self) -> List[Tuple[str, float]]:
+        if self._style_refs is None:
+            style = self.project.style
+            self._style_refs = []
+            if style.ref_image and self._exists(style.ref_image):
+                self._style_refs.append((style.ref_image, style.weight))
+        return self._style_refs
+
+
 # ============================================
 # 苍何 API 图像生成器
 # ============================================
@@ -138,6 +247,8 @@ class CangheImageGenerator:
     POLL_INTERVAL = 2.0  # 轮询间隔(秒)
     MAX_POLL_ATTEMPTS = 60  # 最大轮询次数
     REQUEST_TIMEOUT = 180.0  # 请求超时(秒)
+    POOL_LIMITS = httpx.Limits(max_keepalive_connections=8, max_connections=16)
+    MAX_CONCURRENT_SHOTS = 4  # 批量生成时的最大并发数, 避免触发 API 限流
 
     def __init__(self, api_key: str = "", output_dir: str = "outputs", model: str = None):
         """
@@ -166,17 +277,77 @@ class CangheImageGenerator:
             "Authorization": f"Bearer {self.api_key}"
         }
 
+        # 批量生成期间的项目参考图索引 (批次结束后清除)
+        self._ref_index: Optional[_RefIndex] = None
+        # 输出文件序号, 保证并发生成时文件名唯一
+        self._output_seq = itertools.count(1)
+
+        # 持久连接: 所有调用线程共用一个后台事件循环及其 AsyncClient (连接绑定在事件循环上),
+        # 下载图片共用一个线程安全的同步 Client, 多镜头生成时免去重复的 TCP/TLS 握手.
+        # 事件循环在首次生成时启动, 由 close() 停止
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._loop_lock = threading.Lock()
+        self._download_client = httpx.Client(
+            timeout=60.0,
+            follow_redirects=True,
+            transport=httpx.HTTPTransport(retries=3, limits=self.POOL_LIMITS)
+        )
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取生成器的后台事件循环 (首次调用时在守护线程中启动)"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="canghe-generator", daemon=True)
+                thread.start()
+                self._async_client = httpx.AsyncClient(
+                    headers=self.headers,
+                    timeout=self.REQUEST_TIMEOUT,
+                    transport=httpx.AsyncHTTPTransport(retries=3, limits=self.POOL_LIMITS)
+                )
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    def _run(self, coro):
+        """在后台事件循环中执行协程并阻塞等待结果 (可从任意线程调用)"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        """后台事件循环的 AsyncClient (只在该事件循环中使用)"""
+        return self._async_client
+
+    def close(self):
+        """关闭持久连接并停止后台事件循环"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+            thread, self._loop_thread = self._loop_thread, None
+            client, self._async_client = self._async_client, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self._download_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def get_aspect_ratio_dimensions(self, aspect_ratio: str) -> Tuple[int, int]:
         """获取宽高比对应的像素尺寸"""
-        ratios = {
-            "16:9": (1024, 576),
-            "9:16": (576, 1024),
-            "1:1": (768, 768),
-            "4:3": (896, 672),
-            "3:4": (672, 896),
-            "21:9": (1024, 440)
-        }
-        return ratios.get(aspect_ratio, (1024, 576))
+        return _ASPECT_RATIOS.get(aspect_ratio, _DEFAULT_DIMENSIONS)
+
+    def _reference_index(self, project: StoryboardProject) -> _RefIndex:
+        """批量生成期间复用同一索引; 单次调用时临时构建, 避免项目修改后读到过期数据"""
+        index = self._ref_index
+        if index is not None and index.project is project:
+            return index
+        return _RefIndex(project, os.path.exists)
 
     def collect_reference_images(
         self,
@@ -184,42 +355,32 @@ class CangheImageGenerator:
         project: StoryboardProject
     ) -> Tuple[List[str], List[float]]:
         """收集参考图片和权重"""
-        images = []
-        weights = []
+        refs: List[Tuple[str, float]] = []
         slot_weights = shot.slot_weights
+        index = self._reference_index(project)
 
         # 角色参考
+        scale = slot_weights.character
         for char_id in shot.characters_in_shot:
-            char = project.get_character_by_id(char_id)
-            if char and char.ref_images:
-                for ref_img in char.ref_images[:2]:
-                    if os.path.exists(ref_img):
-                        images.append(ref_img)
-                        weights.append(slot_weights.character * char.consistency_weight)
+            refs.extend((ref_img, scale * weight) for ref_img, weight in index.character_refs(char_id))
 
         # 场景参考
-        scene = project.get_scene_by_id(shot.scene_id)
-        if scene:
-            if scene.space_ref_image and os.path.exists(scene.space_ref_image):
-                images.append(scene.space_ref_image)
-                weights.append(slot_weights.scene * scene.consistency_weight)
-            if scene.atmosphere_ref_image and os.path.exists(scene.atmosphere_ref_image):
-                images.append(scene.atmosphere_ref_image)
-                weights.append(slot_weights.scene * 0.5)
+        scale = slot_weights.scene
+        refs.extend((ref_img, scale * weight) for ref_img, weight in index.scene_refs(shot.scene_id))
 
         # 道具参考
+        scale = slot_weights.props
         for prop_id in shot.props_in_shot:
-            prop = project.get_prop_by_id(prop_id)
-            if prop and prop.ref_image and os.path.exists(prop.ref_image):
-                images.append(prop.ref_image)
-                weights.append(slot_weights.props * prop.consistency_weight)
+            refs.extend((ref_img, scale * weight) for ref_img, weight in index.prop_refs(prop_id))
 
         # 风格参考
-        if project.style.ref_image and os.path.exists(project.style.ref_image):
-            images.append(project.style.ref_image)
-            weights.append(slot_weights.style * project.style.weight)
+        scale = slot_weights.style
+        refs.extend((ref_img, scale * weight) for ref_img, weight in index.style_refs())
 
-        return images, weights
+        if not refs:
+            return [], []
+        images, weights = zip(*refs)
+        return list(images), list(weights)
 
     # ========================================
     # Nano-Banana (Fal.ai Imagen) 生成
@@ -233,67 +394,67 @@ class CangheImageGenerator:
         """使用 nano-banana 模型生成图像"""
         print(f"[Nano-Banana] 开始调用 API...")
         print(f"[Nano-Banana] API URL: {self.BASE_URL}/fal-ai/nano-banana")
-        async with httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT) as client:
+        client = self._client
+        try:
+            # 1. 提交生成任务
+            url = f"{self.BASE_URL}/fal-ai/nano-banana"
+            payload = {
+                "prompt": prompt,
+                "num_images": min(max(num_images, 1), 4)
+            }
+            print(f"[Nano-Banana] 发送请求中...")
+
+            response = await client.post(url, json=payload)
+            print(f"[Nano-Banana] 响应状态: {response.status_code}")
+
+            # 先尝试解析 JSON，即使是错误响应也可能包含有用信息
             try:
-                # 1. 提交生成任务
-                url = f"{self.BASE_URL}/fal-ai/nano-banana"
-                payload = {
-                    "prompt": prompt,
-                    "num_images": min(max(num_images, 1), 4)
-                }
-                print(f"[Nano-Banana] 发送请求中...")
-
-                response = await client.post(url, json=payload, headers=self.headers)
-                print(f"[Nano-Banana] 响应状态: {response.status_code}")
-
-                # 先尝试解析 JSON，即使是错误响应也可能包含有用信息
-                try:
-                    data = response.json()
-                except:
-                    data = {}
-
-                # 检查 HTTP 错误或 API 返回错误状态
-                if response.status_code >= 400 or data.get("status") == "FAILED":
-                    error_msg = data.get("message", f"HTTP {response.status_code}")
-                    print(f"[Nano-Banana] API 错误: {error_msg}")
-                    return False, [], f"Nano-Banana 不可用: {error_msg}"
-
-                request_id = data.get("request_id")
-                if not request_id:
-                    print(f"[Nano-Banana] 错误: 未获取到 request_id, 响应: {data}")
-                    return False, [], "未获取到 request_id"
-
-                print(f"[Nano-Banana] 任务已提交, request_id: {request_id}")
-
-                # 2. 轮询获取结果
-                result_url = f"{self.BASE_URL}/fal-ai/nano-banana/requests/{request_id}"
-
-                for attempt in range(self.MAX_POLL_ATTEMPTS):
-                    await asyncio.sleep(self.POLL_INTERVAL)
-
-                    result_response = await client.get(result_url, headers=self.headers)
-                    result_response.raise_for_status()
-                    result_data = result_response.json()
-
-                    status = result_data.get("status", "")
-                    if attempt % 5 == 0:  # 每5次打印一次状态
-                        print(f"[Nano-Banana] 轮询 {attempt+1}/{self.MAX_POLL_ATTEMPTS}, 状态: {status}")
-
-                    if status == FalAIStatus.COMPLETED or "images" in result_data:
-                        images = result_data.get("images", [])
-                        print(f"[Nano-Banana] ✓ 生成成功! 获取到 {len(images)} 张图片")
-                        return True, images, ""
-                    elif status == FalAIStatus.FAILED:
-                        print(f"[Nano-Banana] ✗ 生成失败: {result_data}")
-                        return False, [], f"生成失败: {result_data}"
-
-                print(f"[Nano-Banana] ✗ 生成超时")
-                return False, [], "生成超时"
-
-            except httpx.HTTPStatusError as e:
-                return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
-            except Exception as e:
-                return False, [], f"生成失败: {str(e)}"
+                data = response.json()
+            except:
+                data = {}
+
+            # 检查 HTTP 错误或 API 返回错误状态
+            if response.status_code >= 400 or data.get("status") == "FAILED":
+                error_msg = data.get("message", f"HTTP {response.status_code}")
+                print(f"[Nano-Banana] API 错误: {error_msg}")
+                return False, [], f"Nano-Banana 不可用: {error_msg}"
+
+            request_id = data.get("request_id")
+            if not request_id:
+                print(f"[Nano-Banana] 错误: 未获取到 request_id, 响应: {data}")
+                return False, [], "未获取到 request_id"
+
+            print(f"[Nano-Banana] 任务已提交, request_id: {request_id}")
+
+            # 2. 轮询获取结果
+            result_url = f"{self.BASE_URL}/fal-ai/nano-banana/requests/{request_id}"
+
+            for attempt in range(self.MAX_POLL_ATTEMPTS):
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+                result_response = await client.get(result_url)
+                result_response.raise_for_status()
+                result_data = result_response.json()
+
+                status = result_data.get("status", "")
+                if attempt % 5 == 0:  # 每5次打印一次状态
+                    print(f"[Nano-Banana] 轮询 {attempt+1}/{self.MAX_POLL_ATTEMPTS}, 状态: {status}")
+
+                if status == FalAIStatus.COMPLETED or "images" in result_data:
+                    images = result_data.get("images", [])
+                    print(f"[Nano-Banana] ✓ 生成成功! 获取到 {len(images)} 张图片")
+                    return True, images, ""
+                elif status == FalAIStatus.FAILED:
+                    print(f"[Nano-Banana] ✗ 生成失败: {result_data}")
+                    return False, [], f"生成失败: {result_data}"
+
+            print(f"[Nano-Banana] ✗ 生成超时")
+            return False, [], "生成超时"
+
+        except httpx.HTTPStatusError as e:
+            return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
+        except Exception as e:
+            return False, [], f"生成失败: {str(e)}"
 
     # ========================================
     # DALL-E 3 图像生成
@@ -307,37 +468,37 @@ class CangheImageGenerator:
         """使用 DALL-E 3 模型生成图像"""
         print(f"[DALL-E 3] 开始调用 API...")
         print(f"[DALL-E 3] 尺寸: {size}")
-        async with httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT) as client:
-            try:
-                url = f"{self.BASE_URL}/v1/images/generations"
-                payload = {
-                    "model": "dall-e-3",
-                    "prompt": prompt,
-                    "n": 1,
-                    "size": size,
-                    "quality": "standard"
-                }
-
-                print(f"[DALL-E 3] 发送请求中...")
-                response = await client.post(url, json=payload, headers=self.headers)
-                print(f"[DALL-E 3] 响应状态: {response.status_code}")
-                response.raise_for_status()
-                data = response.json()
+        client = self._client
+        try:
+            url = f"{self.BASE_URL}/v1/images/generations"
+            payload = {
+                "model": "dall-e-3",
+                "prompt": prompt,
+                "n": 1,
+                "size": size,
+                "quality": "standard"
+            }
+
+            print(f"[DALL-E 3] 发送请求中...")
+            response = await client.post(url, json=payload)
+            print(f"[DALL-E 3] 响应状态: {response.status_code}")
+            response.raise_for_status()
+            data = response.json()
 
-                # DALL-E 3 直接返回结果，不需要轮询
-                images = data.get("data", [])
-                if images:
-                    print(f"[DALL-E 3] ✓ 生成成功! 获取到 {len(images)} 张图片")
-                    return True, images, ""
-                else:
-                    print(f"[DALL-E 3] ✗ 未获取到图像数据")
-                    return False, [], "未获取到图像数据"
+            # DALL-E 3 直接返回结果，不需要轮询
+            images = data.get("data", [])
+            if images:
+                print(f"[DALL-E 3] ✓ 生成成功! 获取到 {len(images)} 张图片")
+                return True, images, ""
+            else:
+                print(f"[DALL-E 3] ✗ 未获取到图像数据")
+                return False, [], "未获取到图像数据"
 
-            except httpx.HTTPStatusError as e:
-                print(f"[DALL-E 3] ✗ HTTP 错误: {e.response.status_code}")
-                return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
-            except Exception as e:
-                return False, [], f"生成失败: {str(e)}"
+        except httpx.HTTPStatusError as e:
+            print(f"[DALL-E 3] ✗ HTTP 错误: {e.response.status_code}")
+            return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
+        except Exception as e:
+            return False, [], f"生成失败: {str(e)}"
 
     # ========================================
     # 即梦 (Jimeng) 图像生成
@@ -349,74 +510,64 @@ class CangheImageGenerator:
         aspect_ratio: str = "16:9"
     ) -> Tuple[bool, List[Dict], str]:
         """使用即梦模型生成图像"""
-        async with httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT) as client:
-            try:
-                # 1. 提交生成任务
-                url = f"{self.BASE_URL}/jimeng/submit/images"
-
-                # 转换宽高比格式
-                jimeng_ratios = {
-                    "16:9": "16:9",
-                    "9:16": "9:16",
-                    "1:1": "1:1",
-                    "4:3": "4:3",
-                    "3:4": "3:4",
-                    "21:9": "21:9"
-                }
-
-                payload = {
-                    "prompt": prompt,
-                    "aspect_ratio": jimeng_ratios.get(aspect_ratio, "16:9"),
-                    "num_images": 1
-                }
-
-                response = await client.post(url, json=payload, headers=self.headers)
-                response.raise_for_status()
-                data = response.json()
+        client = self._client
+        try:
+            # 1. 提交生成任务
+            url = f"{self.BASE_URL}/jimeng/submit/images"
 
-                # 检查响应
-                if data.get("code") != "success":
-                    return False, [], f"提交失败: {data.get('message', '未知错误')}"
+            payload = {
+                "prompt": prompt,
+                "aspect_ratio": aspect_ratio if aspect_ratio in _JIMENG_RATIOS else "16:9",
+                "num_images": 1
+            }
 
-                task_id = data.get("data")
-                if not task_id:
-                    return False, [], "未获取到 task_id"
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+            data = response.json()
 
-                # 2. 轮询获取结果
-                result_url = f"{self.BASE_URL}/jimeng/fetch/{task_id}"
+            # 检查响应
+            if data.get("code") != "success":
+                return False, [], f"提交失败: {data.get('message', '未知错误')}"
 
-                for attempt in range(self.MAX_POLL_ATTEMPTS):
-                    await asyncio.sleep(self.POLL_INTERVAL)
+            task_id = data.get("data")
+            if not task_id:
+                return False, [], "未获取到 task_id"
 
-                    result_response = await client.get(result_url, headers=self.headers)
-                    result_response.raise_for_status()
-                    result_data = result_response.json()
+            # 2. 轮询获取结果
+            result_url = f"{self.BASE_URL}/jimeng/fetch/{task_id}"
 
-                    if result_data.get("code") != "success":
-                        continue
+            for attempt in range(self.MAX_POLL_ATTEMPTS):
+                await asyncio.sleep(self.POLL_INTERVAL)
 
-                    task_info = result_data.get("data", {})
-                    status = task_info.get("status", "")
+                result_response = await client.get(result_url)
+                result_response.raise_for_status()
+                result_data = result_response.json()
 
-                    if status == JimengStatus.SUCCESS:
-                        # 解析图片数据
-                        inner_data = task_info.get("data", {})
-                        if isinstance(inner_data, dict):
-                            image_data = inner_data.get("data", {})
-                            if isinstance(image_data, dict):
-                                image_url = image_data.get("image") or image_data.get("images", [{}])[0].get("url", "")
-                                if image_url:
-                                    return True, [{"url": image_url}], ""
-                        return False, [], "未找到图片 URL"
-                    elif status == JimengStatus.FAILURE:
-                        return False, [], f"即梦生成失败: {task_info.get('fail_reason', '未知原因')}"
+                if result_data.get("code") != "success":
+                    continue
 
-                return False, [], "即梦生成超时"
+                task_info = result_data.get("data", {})
+                status = task_info.get("status", "")
 
-            except httpx.HTTPStatusError as e:
-                return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
-            except Exception as e:
-                return False, [], f"即梦生成失败: {str(e)}"
+                if status == JimengStatus.SUCCESS:
+                    # 解析图片数据
+                    inner_data = task_info.get("data", {})
+                    if isinstance(inner_data, dict):
+                        image_data = inner_data.get("data", {})
+                        if isinstance(image_data, dict):
+                            image_url = image_data.get("image") or image_data.get("images", [{}])[0].get("url", "")
+                            if image_url:
+                                return True, [{"url": image_url}], ""
+                    return False, [], "未找到图片 URL"
+                elif status == JimengStatus.FAILURE:
+                    return False, [], f"即梦生成失败: {task_info.get('fail_reason', '未知原因')}"
+
+            return False, [], "即梦生成超时"
+
+        except httpx.HTTPStatusError as e:
+            return False, [], f"HTTP 错误: {e.response.status_code} - {e.response.text}"
+        except Exception as e:
+            return False, [], f"即梦生成失败: {str(e)}"
 
     # ========================================
     # 通用方法
@@ -428,12 +579,27 @@ class CangheImageGenerator:
         print(f"[下载] URL: {url[:100]}...")
         print(f"[下载] 保存路径: {save_path}")
         try:
-            response = httpx.get(url, timeout=60.0, follow_redirects=True)
-            response.raise_for_status()
-            print(f"[下载] HTTP 状态: {response.status_code}, 内容大小: {len(response.content)} bytes")
+            if url.startswith("data:"):
+                # 内联 data URI: 直接一次性解码, 无需再发起 HTTP 请求
+                header, _, encoded = url.partition(",")
+                if ";base64" not in header:
+                    raise ValueError(f"不支持的 data URI: {header[:40]}")
+                content = binascii.a2b_base64(encoded.encode("ascii"))
+                print(f"[下载] data URI 解码完成, 内容大小: {len(content)} bytes")
+            else:
+                response = self._download_client.get(url, headers={"Accept": "image/*"})
+                response.raise_for_status()
+                content = response.content
+                print(f"[下载] HTTP 状态: {response.status_code}, 内容大小: {len(content)} bytes")
             save_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(save_path, "wb") as f:
-                f.write(response.content)
+            # 直接 os.write 写入, 跳过 BufferedWriter 的二次缓冲
+            fd = os.open(str(save_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                view = memoryview(content)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
             print(f"[下载] ✓ 保存成功: {save_path}")
             return True
         except Exception as e:
@@ -444,17 +610,26 @@ class CangheImageGenerator:
         self,
         shot: Shot,
         project: StoryboardProject,
-        prompt: str
+        prompt: str,
+        batch_ts: Optional[str] = None
     ) -> GenerationResult:
         """生成单个镜头的图像"""
+        # 在后台事件循环中执行, 复用其持久连接
+        return self._run(self._generate_shot_async(shot, project, prompt, batch_ts))
+
+    async def _generate_shot_async(
+        self,
+        shot: Shot,
+        project: StoryboardProject,
+        prompt: str,
+        batch_ts: Optional[str] = None
+    ) -> GenerationResult:
+        """生成单个镜头的图像 (协程版本, 可在同一事件循环中并发)"""
         start_time = time.time()
 
         try:
             # 生成负提示词
-            from prompt_generator import generate_negative_prompt
-            from templates import get_template
-            template = get_template(shot.template)
-            negative_prompt = generate_negative_prompt(template) if template else ""
+            negative_prompt = _negative_prompt_for(shot.template)
 
             # 构建完整提示词
             full_prompt = prompt
@@ -467,60 +642,36 @@ class CangheImageGenerator:
                 full_prompt = f"{consistency_prefix} {full_prompt}"
 
             # 根据模型选择生成方法
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
             used_model = None
-            try:
-                current_model = get_canghe_model()
-                dalle_sizes = {
-                    "16:9": "1792x1024",
-                    "9:16": "1024x1792",
-                    "1:1": "1024x1024",
-                    "4:3": "1024x1024",
-                    "3:4": "1024x1024",
-                }
-
-                if current_model == CangheImageModel.JIMENG:
-                    # 即梦API不支持图像生成，自动回退到 nano-banana
-                    print(f"[INFO] 即梦仅支持视频生成，自动使用 nano-banana 生成图像...")
-                    used_model = CangheImageModel.NANO_BANANA
-                    success, images, error = loop.run_until_complete(
-                        self._generate_nano_banana_async(full_prompt, num_images=1)
-                    )
-                    # 如果 nano-banana 也失败，继续回退到 DALL-E 3
-                    if not success:
-                        print(f"[INFO] Nano-Banana 失败，继续切换到 DALL-E 3...")
-                        used_model = CangheImageModel.DALLE3
-                        size = dalle_sizes.get(project.aspect_ratio, "1024x1024")
-                        success, images, error = loop.run_until_complete(
-                            self._generate_dalle3_async(full_prompt, size=size)
-                        )
-                elif current_model == CangheImageModel.DALLE3:
-                    print(f"[INFO] 使用 DALL-E 3 模型生成图像...")
+            current_model = get_canghe_model()
+            size = _DALLE_SIZES.get(project.aspect_ratio, "1024x1024")
+
+            if current_model == CangheImageModel.JIMENG:
+                # 即梦API不支持图像生成，自动回退到 nano-banana
+                print(f"[INFO] 即梦仅支持视频生成，自动使用 nano-banana 生成图像...")
+                used_model = CangheImageModel.NANO_BANANA
+                success, images, error = await self._generate_nano_banana_async(full_prompt, num_images=1)
+                # 如果 nano-banana 也失败，继续回退到 DALL-E 3
+                if not success:
+                    print(f"[INFO] Nano-Banana 失败，继续切换到 DALL-E 3...")
                     used_model = CangheImageModel.DALLE3
-                    size = dalle_sizes.get(project.aspect_ratio, "1024x1024")
-                    success, images, error = loop.run_until_complete(
-                        self._generate_dalle3_async(full_prompt, size=size)
-                    )
-                else:
-                    # Nano-Banana，如果失败自动切换到 DALL-E 3
-                    print(f"[INFO] 使用 nano-banana 模型生成图像...")
-                    used_model = CangheImageModel.NANO_BANANA
-                    success, images, error = loop.run_until_complete(
-                        self._generate_nano_banana_async(full_prompt, num_images=1)
-                    )
-
-                    # 如果 Nano-Banana 失败，自动尝试 DALL-E 3
-                    if not success:
-                        print(f"[INFO] Nano-Banana 失败 ({error[:80] if error else '未知错误'})，自动切换到 DALL-E 3...")
-                        used_model = CangheImageModel.DALLE3
-                        size = dalle_sizes.get(project.aspect_ratio, "1024x1024")
-                        success, images, error = loop.run_until_complete(
-                            self._generate_dalle3_async(full_prompt, size=size)
-                        )
-                        print(f"[DEBUG] DALL-E 3 结果: success={success}, images_count={len(images) if images else 0}, error={error[:80] if error else 'None'}")
-            finally:
-                loop.close()
+                    success, images, error = await self._generate_dalle3_async(full_prompt, size=size)
+            elif current_model == CangheImageModel.DALLE3:
+                print(f"[INFO] 使用 DALL-E 3 模型生成图像...")
+                used_model = CangheImageModel.DALLE3
+                success, images, error = await self._generate_dalle3_async(full_prompt, size=size)
+            else:
+                # Nano-Banana，如果失败自动切换到 DALL-E 3
+                print(f"[INFO] 使用 nano-banana 模型生成图像...")
+                used_model = CangheImageModel.NANO_BANANA
+                success, images, error = await self._generate_nano_banana_async(full_prompt, num_images=1)
+
+                # 如果 Nano-Banana 失败，自动尝试 DALL-E 3
+                if not success:
+                    print(f"[INFO] Nano-Banana 失败 ({error[:80] if error else '未知错误'})，自动切换到 DALL-E 3...")
+                    used_model = CangheImageModel.DALLE3
+                    success, images, error = await self._generate_dalle3_async(full_prompt, size=size)
+                    print(f"[DEBUG] DALL-E 3 结果: success={success}, images_count={len(images) if images else 0}, error={error[:80] if error else 'None'}")
 
             generation_time = time.time() - start_time
 
@@ -531,7 +682,7 @@ class CangheImageGenerator:
                 print(f"[DEBUG] 获取到图片 URL: {image_url[:80] if image_url else 'None'}...")
 
                 if image_url:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    timestamp = batch_ts or datetime.now().strftime("%Y%m%d_%H%M%S")
                     model_map = {
                         CangheImageModel.JIMENG: "jimeng",
                         CangheImageModel.DALLE3: "dalle3",
@@ -539,13 +690,14 @@ class CangheImageGenerator:
                     }
                     # 使用实际使用的模型，而不是配置的模型（因为可能有 fallback）
                     model_suffix = model_map.get(used_model or get_canghe_model(), "img")
-                    filename = f"shot_{shot.shot_number:03d}_{timestamp}_{model_suffix}.png"
+                    filename = f"shot_{shot.shot_number:03d}_{timestamp}_{next(self._output_seq):04d}_{model_suffix}.png"
                     safe_project_name = sanitize_filename(project.name)
                     output_path = self.output_dir / safe_project_name / filename
                     print(f"[DEBUG] 项目名: {project.name} -> {safe_project_name}")
                     print(f"[DEBUG] 保存路径: {output_path}")
 
-                    if self._download_image(image_url, output_path):
+                    # 下载为阻塞 I/O, 放到线程中执行以免阻塞其他镜头
+                    if await asyncio.to_thread(self._download_image, image_url, output_path):
                         print(f"[DEBUG] 下载成功，文件存在: {output_path.exists()}, 大小: {output_path.stat().st_size if output_path.exists() else 0}")
                         return GenerationResult(
                             success=True,
@@ -583,25 +735,52 @@ class CangheImageGenerator:
         self,
         project: StoryboardProject,
         prompts: Dict[int, str],
-        progress_callback=None
+        progress_callback=None,
+        shots: Optional[List[Shot]] = None
     ) -> List[GenerationResult]:
-        """批量生成所有镜头"""
-        results = []
-
-        for i, shot in enumerate(project.shots):
-            if progress_callback:
-                progress_callback(i, len(project.shots), f"正在生成镜头 {shot.shot_number}...")
+        """
+        批量生成镜头 (并发执行, 最多 MAX_CONCURRENT_SHOTS 个同时进行)
 
-            prompt = prompts.get(shot.shot_number, shot.generated_prompt)
-            result = self.generate_shot(shot, project, prompt)
-            results.append(result)
+        shots 默认为项目全部镜头; 返回结果与 shots 顺序一致
+        """
+        if shots is None:
+            shots = project.shots
+        # stat 结果只在本批次内缓存, 批次之间上传/删除的参考图能被及时发现
+        self._ref_index = _RefIndex(project, functools.lru_cache(maxsize=None)(os.path.exists))
+        try:
+            results = self._run(self._generate_all_async(project, shots, prompts, progress_callback))
+        finally:
+            self._ref_index = None
 
+        for shot, result in zip(shots, results):
             if result.success:
                 shot.output_image = result.image_path
                 shot.consistency_score = result.consistency_score
 
         return results
 
+    async def _generate_all_async(
+        self,
+        project: StoryboardProject,
+        shots: List[Shot],
+        prompts: Dict[int, str],
+        progress_callback=None
+    ) -> List[GenerationResult]:
+        """并发生成镜头, 结果顺序与 shots 一致"""
+        sem = asyncio.Semaphore(self.MAX_CONCURRENT_SHOTS)
+        total = len(shots)
+        # 整批镜头共用一个时间戳
+        batch_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        async def generate_one(i: int, shot: Shot) -> GenerationResult:
+            async with sem:
+                if progress_callback:
+                    progress_callback(i, total, f"正在生成镜头 {shot.shot_number}...")
+                prompt = prompts.get(shot.shot_number, shot.generated_prompt)
+                return await self._generate_shot_async(shot, project, prompt, batch_ts)
+
+        return await asyncio.gather(*(generate_one(i, shot) for i, shot in enumerate(shots)))
+
 
 # ============================================
 # ComfyUI 图像生成器
@@ -610,36 +789,64 @@ class CangheImageGenerator:
 class ComfyUIImageGenerator:
     """ComfyUI 本地图像生成器"""
 
+    # 连接检测结果的有效期 (秒), 期间不再逐镜头发起探测请求
+    CONNECTION_CHECK_TTL = 60.0
+    # 批量生成时同时提交的任务数: GPU 一次只渲染一个, 多出的窗口用于
+    # 在渲染当前镜头时上传/排队下一个镜头、下载上一个镜头
+    PIPELINE_DEPTH = 3
+
     def __init__(self, output_dir: str = "outputs"):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.client = None
         self._initialized = False
+        self._enabled = False
         self._project_seed = None
+        self._conn_ok = False
+        self._conn_msg = ""
+        self._conn_checked_at = 0.0
+
+    def close(self):
+        """关闭 ComfyUI 客户端连接"""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self._initialized = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def _ensure_client(self):
-        """确保 ComfyUI 客户端已初始化"""
-        if self._initialized:
-            return
+        """确保 ComfyUI 客户端已初始化且已启用 (启用状态只在初始化时读取一次)"""
+        if not self._initialized:
+            if not HAS_COMFYUI:
+                raise RuntimeError("ComfyUI 客户端依赖未安装 (需要 requests 与 websocket-client)")
 
-        try:
-            from comfyui_client import create_comfyui_client_from_settings
-            self.client = create_comfyui_client_from_settings()
+            try:
+                self.client = create_comfyui_client_from_settings()
+            except Exception as e:
+                raise RuntimeError(f"初始化 ComfyUI 客户端失败: {e}")
+            self._enabled = self.client.is_enabled()
             self._initialized = True
-        except Exception as e:
-            raise RuntimeError(f"初始化 ComfyUI 客户端失败: {e}")
+
+        if not self._enabled:
+            raise RuntimeError("ComfyUI 未启用。请在 .env 中设置 IMAGE_BACKEND=comfyui 和 COMFYUI_ENABLED=true")
+
+    def _check_connection(self) -> Tuple[bool, str]:
+        """检测 ComfyUI 连接 (成功结果按 TTL 缓存, 失败时下次调用立即重试)"""
+        now = time.monotonic()
+        if self._conn_ok and now - self._conn_checked_at < self.CONNECTION_CHECK_TTL:
+            return True, self._conn_msg
+        self._conn_ok, self._conn_msg = self.client.test_connection()
+        self._conn_checked_at = now
+        return self._conn_ok, self._conn_msg
 
     def get_aspect_ratio_dimensions(self, aspect_ratio: str) -> Tuple[int, int]:
         """获取宽高比对应的像素尺寸"""
-        ratios = {
-            "16:9": (1024, 576),
-            "9:16": (576, 1024),
-            "1:1": (768, 768),
-            "4:3": (896, 672),
-            "3:4": (672, 896),
-            "21:9": (1024, 440)
-        }
-        return ratios.get(aspect_ratio, (1024, 576))
+        return _ASPECT_RATIOS.get(aspect_ratio, _DEFAULT_DIMENSIONS)
 
     def _get_seed_for_project(self, project: StoryboardProject) -> int:
         """获取生成种子"""
@@ -662,70 +869,28 @@ class ComfyUIImageGenerator:
         """使用 ComfyUI 生成图像"""
         start_time = time.time()
 
+        # 前置检查: 客户端与启用状态只初始化一次
         try:
             self._ensure_client()
+        except RuntimeError as e:
+            return GenerationResult(success=False, error_message=str(e))
 
-            if not self.client.is_enabled():
-                return GenerationResult(
-                    success=False,
-                    error_message="ComfyUI 未启用。请在 .env 中设置 IMAGE_BACKEND=comfyui 和 COMFYUI_ENABLED=true"
-                )
-
-            # 测试连接
-            connected, msg = self.client.test_connection()
-            if not connected:
-                return GenerationResult(
-                    success=False,
-                    error_message=f"ComfyUI 连接失败: {msg}"
-                )
-
-            from comfyui_client import GenerationParams
-
-            # 获取尺寸
-            width, height = self.get_aspect_ratio_dimensions(project.aspect_ratio)
-
-            # 生成负提示词
-            from prompt_generator import generate_negative_prompt
-            from templates import get_template
-            template = get_template(shot.template)
-            negative_prompt = generate_negative_prompt(template) if template else "low quality, blurry, deformed"
-
-            # 添加一致性前缀
-            consistency_prefix = project.get_consistency_prefix()
-            if consistency_prefix:
-                prompt = f"{consistency_prefix} {prompt}"
-
-            # 获取种子
-            seed = self._get_seed_for_project(project)
-
-            params = GenerationParams(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                width=width,
-                height=height,
-                steps=20,
-                cfg_scale=7.0,
-                seed=seed
+        # 测试连接 (短时间内复用上次结果, 真实连接错误由生成调用本身报告)
+        connected, msg = self._check_connection()
+        if not connected:
+            return GenerationResult(
+                success=False,
+                error_message=f"ComfyUI 连接失败: {msg}"
             )
 
-            # 收集参考图像
-            ref_images = []
-            for char_id in shot.characters_in_shot:
-                char = project.get_character_by_id(char_id)
-                if char and char.ref_images:
-                    for ref_img in char.ref_images[:1]:
-                        if os.path.exists(ref_img):
-                            ref_images.append(ref_img)
-                            break
+        params = self._build_params(shot, project, prompt)
 
+        # 仅在实际的 I/O 与网络调用外包裹异常处理
+        try:
             # 准备输出目录
-            safe_project_name = sanitize_filename(project.name)
-            project_output = self.output_dir / safe_project_name
-            project_output.mkdir(parents=True, exist_ok=True)
+            project_output = self._project_output_dir(project)
 
-            if ref_images:
-                params.ref_image_path = ref_images[0]
-                params.denoise = 0.7
+            if params.ref_image_path:
                 result = self.client.image_to_image(
                     params,
                     output_dir=str(project_output)
@@ -735,29 +900,139 @@ class ComfyUIImageGenerator:
                     params,
                     output_dir=str(project_output)
                 )
+        except Exception as e:
+            self._conn_ok = False
+            return GenerationResult(
+                success=False,
+                error_message=f"ComfyUI 生成异常: {str(e)}",
+                generation_time=time.time() - start_time
+            )
 
-            generation_time = time.time() - start_time
+        return self._to_generation_result(result, time.time() - start_time)
 
-            if result.success and result.images:
-                return GenerationResult(
-                    success=True,
-                    image_path=result.images[0],
-                    consistency_score=0.85,
-                    generation_time=generation_time
-                )
-            else:
-                return GenerationResult(
-                    success=False,
-                    error_message=result.error or "ComfyUI 生成失败",
-                    generation_time=generation_time
-                )
+    def generate_all_shots(
+        self,
+        project: StoryboardProject,
+        prompts: Dict[int, str],
+        progress_callback=None,
+        shots: Optional[List[Shot]] = None
+    ) -> List[GenerationResult]:
+        """
+        批量生成镜头 (流水线提交, 最多 PIPELINE_DEPTH 个任务同时在途)
+
+        shots 默认为项目全部镜头; 返回结果与 shots 顺序一致。每个任务使用独立的
+        client_id, 多个镜头同时在途时完成消息不会串到其他任务上
+        """
+        start_time = time.time()
+        if shots is None:
+            shots = project.shots
+
+        try:
+            self._ensure_client()
+        except RuntimeError as e:
+            return [GenerationResult(success=False, error_message=str(e)) for _ in shots]
+
+        connected, msg = self._check_connection()
+        if not connected:
+            return [GenerationResult(success=False, error_message=f"ComfyUI 连接失败: {msg}") for _ in shots]
+
+        params_list = [
+            self._build_params(shot, project, prompts.get(shot.shot_number, shot.generated_prompt))
+            for shot in shots
+        ]
+        total = len(shots)
 
+        def on_start(i: int):
+            if progress_callback:
+                progress_callback(i, total, f"正在生成镜头 {shots[i].shot_number}...")
+
+        try:
+            project_output = self._project_output_dir(project)
+            batch = self.client.generate_batch(
+                params_list,
+                output_dir=str(project_output),
+                max_in_flight=self.PIPELINE_DEPTH,
+                on_start=on_start
+            )
         except Exception as e:
-            return GenerationResult(
+            self._conn_ok = False
+            error = GenerationResult(
                 success=False,
                 error_message=f"ComfyUI 生成异常: {str(e)}",
                 generation_time=time.time() - start_time
             )
+            return [error for _ in shots]
+
+        results = [self._to_generation_result(r, r.generation_time) for r in batch]
+        for shot, result in zip(shots, results):
+            if result.success:
+                shot.output_image = result.image_path
+                shot.consistency_score = result.consistency_score
+
+        return results
+
+    def _project_output_dir(self, project: StoryboardProject) -> Path:
+        project_output = self.output_dir / sanitize_filename(project.name)
+        project_output.mkdir(parents=True, exist_ok=True)
+        return project_output
+
+    def _build_params(self, shot: Shot, project: StoryboardProject, prompt: str) -> "GenerationParams":
+        """构建单个镜头的 ComfyUI 生成参数"""
+        # 获取尺寸
+        width, height = self.get_aspect_ratio_dimensions(project.aspect_ratio)
+
+        # 生成负提示词
+        negative_prompt = _negative_prompt_for(shot.template, "low quality, blurry, deformed")
+
+        # 添加一致性前缀
+        consistency_prefix = project.get_consistency_prefix()
+        if consistency_prefix:
+            prompt = f"{consistency_prefix} {prompt}"
+
+        # 获取种子
+        seed = self._get_seed_for_project(project)
+
+        params = GenerationParams(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            steps=20,
+            cfg_scale=7.0,
+            seed=seed
+        )
+
+        # 收集参考图像 (取第一个有参考图的角色)
+        for char_id in shot.characters_in_shot:
+            char = project.get_character_by_id(char_id)
+            if char and char.ref_images:
+                ref_img = char.ref_images[0]
+                if os.path.exists(ref_img):
+                    params.ref_image_path = ref_img
+                    params.denoise = 0.7
+                    break
+
+        return params
+
+    def _to_generation_result(self, result, generation_time: float) -> GenerationResult:
+        """将 ComfyUI 客户端结果转换为 GenerationResult, 并更新连接检测状态"""
+        if result.success and result.images:
+            # 生成成功即说明连接可用, 顺延检测有效期
+            self._conn_checked_at = time.monotonic()
+            return GenerationResult(
+                success=True,
+                image_path=result.images[0],
+                consistency_score=0.85,
+                generation_time=generation_time
+            )
+        else:
+            # 失败后下次生成重新检测连接
+            self._conn_ok = False
+            return GenerationResult(
+                success=False,
+                error_message=result.error or "ComfyUI 生成失败",
+                generation_time=generation_time
+            )
 
 
 # ============================================
@@ -783,7 +1058,6 @@ def create_generator(api_key: str = "", output_dir: str = "outputs", backend: st
 
     # 方法1: 尝试从 app 模块获取统一配置
     try:
-        import sys
         if 'app' in sys.modules:
             app_module = sys.modules['app']
             if hasattr(app_module, '_canghe_unified_config'):
@@ -802,7 +1076,6 @@ def create_generator(api_key: str = "", output_dir: str = "outputs", backend: st
     # 方法2: 尝试从用户配置文件直接读取
     if not unified_api_key:
         try:
-            import json
             # 尝试多个可能的配置文件路径
             possible_paths = [
                 Path(__file__).parent / "projects" / "_user_config.json",
@@ -3,12 +3,20 @@ AI Storyboard Pro - Data Models
 Based on ai_storyboard_pro_framework.md
 """
 
-from dataclasses import dataclass, field
+from dataclasses import MISSING, dataclass, field, fields, is_dataclass
 from typing import List, Optional, Dict, Any
 from enum import Enum
-import uuid
+from types import MappingProxyType
+from functools import lru_cache
+import json
+import os
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class AssetGenerationStatus(Enum):
     """Status of asset generation"""
@@ -46,7 +54,267 @@ class StyleMode(Enum):
     CUSTOM_TEXT = "custom_text"
 
 
-@dataclass
+# Prompt vocabulary lookups (read-only, shared by all instances)
+_AGE_MAP = MappingProxyType({
+    "child": "young child",
+    "teen": "teenager",
+    "young_adult": "young adult in their 20s",
+    "adult": "adult in their 30s",
+    "middle_aged": "middle-aged person in their 40s-50s",
+    "elderly": "elderly person"
+})
+
+_RENDER_MAP = MappingProxyType({
+    "realistic": "photorealistic",
+    "illustration": "digital illustration",
+    "3d_render": "3D rendered",
+    "watercolor": "watercolor style",
+    "anime": "anime style",
+    "comic": "comic book style"
+})
+
+_TONE_MAP = MappingProxyType({
+    "warm": "warm color palette",
+    "cool": "cool color palette",
+    "high_saturation": "vibrant colors",
+    "low_saturation": "muted colors"
+})
+
+_LIGHT_MAP = MappingProxyType({
+    "natural": "natural lighting",
+    "studio": "studio lighting",
+    "cinematic": "cinematic lighting",
+    "neon": "neon lighting"
+})
+
+
+_datetime_now = datetime.now
+
+
+def _now_iso() -> str:
+    """Current local time as an ISO 8601 string (same format as before)"""
+    return _datetime_now().isoformat()
+
+
+_urandom = os.urandom
+
+
+def _make_id(prefix: str) -> str:
+    """'<prefix>_' + 8 random hex chars, same shape as uuid4().hex[:8] but a single 4-byte draw"""
+    return f"{prefix}_{_urandom(4).hex()}"
+
+
+def _enum_by_value(enum_cls) -> Dict[Any, Enum]:
+    """value -> member map, so deserializing skips the Enum.__call__ machinery"""
+    return {member.value: member for member in enum_cls}
+
+
+_STYLE_MODE_BY_VALUE = _enum_by_value(StyleMode)
+
+
+def _invalidating_setattr(self, name, value):
+    """__setattr__ for classes with a _prompt_cache slot: any field change drops the cache"""
+    object.__setattr__(self, name, value)
+    if name != "_prompt_cache":
+        object.__setattr__(self, "_prompt_cache", None)
+
+
+def _compiled_prompt_builder(name: str, parts) -> Any:
+    """
+    Generate a straight-line prompt builder from (value, part[, skip]) specs.
+
+    Each spec emits "v = <value>; if v: parts.append(<part>)" (with an extra
+    "v != <skip>" guard when given), so the function is plain attribute loads
+    and branches with no per-field formatter dispatch. Expressions are
+    evaluated against self and the module globals.
+    """
+    lines = [f"def {name}(self):", "    parts = []"]
+    for spec in parts:
+        value, part = spec[0], spec[1]
+        guard = f"v and v != {spec[2]!r}" if len(spec) > 2 else "v"
+        lines.append(f"    v = {value}")
+        lines.append(f"    if {guard}:")
+        lines.append(f"        parts.append({part})")
+    lines.append('    return ", ".join(parts)')
+    namespace: Dict[str, Any] = {}
+    exec(compile("\n".join(lines) + "\n", f"<{name}>", "exec"), globals(), namespace)
+    return namespace[name]
+
+
+# Appearance prompt parts, in output order
+_build_appearance_prompt = _compiled_prompt_builder("_build_appearance_prompt", (
+    ("self.gender", "v"),
+    ("self.age", "_AGE_MAP.get(v, v)"),
+    ("self.ethnicity", 'f"{v} ethnicity"'),
+    ("self.skin_tone", 'f"{v} skin"'),
+    ("self.height", 'f"{v} height"'),
+    ("self.body_type", 'f"{v} build"'),
+    ("self.face_shape", 'f"{v} face"'),
+    ("self.eye_color", 'f"{v} eyes"'),
+    ("self.eye_shape", 'f"{v} eye shape"'),
+    ('" ".join(filter(None, (self.hair_color, self.hair_style)))', 'f"{v} hair"'),
+    ("self.hair_texture", 'f"{v} hair texture"'),
+    ("self.facial_hair", 'f"with {v}"', "none"),
+    ("self.glasses", 'f"wearing {v} glasses"', "none"),
+    ("self.scars", 'f"scar: {v}"'),
+    ("self.tattoos", 'f"tattoo: {v}"'),
+    ("self.other_features", "v"),
+))
+
+
+def _interned_from_dict(cls):
+    """
+    Class decorator for frozen value classes: from_dict() hands out one shared
+    instance per distinct content (bounded LRU), so characters with identical
+    data share an object and its cached prompt string. Must be applied above
+    @_compiled_from_dict.
+    """
+    build = cls.from_dict.__func__
+
+    @lru_cache(maxsize=1024)
+    def intern(obj):
+        return obj
+
+    def from_dict(klass, data):
+        obj = build(klass, data)
+        try:
+            return intern(obj)
+        except TypeError:
+            # Unhashable values in malformed data: keep the private instance
+            return obj
+
+    from_dict.__qualname__ = f"{cls.__name__}.from_dict"
+    cls.from_dict = classmethod(from_dict)
+    return cls
+
+
+def _colored(color: str, item: str) -> str:
+    """'<color> <item>' for outfit pieces, or just the item when no color is set"""
+    return f"{color} {item}".strip() if color else item
+
+
+def _compiled_to_dict(cls):
+    """
+    Class decorator: generate a straight-line to_dict() from the dataclass fields.
+
+    The generated function is a single dict literal with direct attribute loads,
+    the same bytecode as a hand-written one. Enum fields serialize as .value,
+    nested dataclasses with their own to_dict() call it, and nested dataclasses
+    without one are inlined as a dict of their fields. init=False fields are
+    internal state and are skipped. Must be applied above @dataclass.
+    """
+    prelude = []
+    entries = []
+    for f in fields(cls):
+        if not f.init:
+            continue
+        attr = f"self.{f.name}"
+        if isinstance(f.type, type) and issubclass(f.type, Enum):
+            # _value_ is the plain instance attribute behind the .value property
+            entries.append(f"{f.name!r}: {attr}._value_")
+        elif is_dataclass(f.type) and hasattr(f.type, "to_dict"):
+            entries.append(f"{f.name!r}: {attr}.to_dict()")
+        elif is_dataclass(f.type):
+            prelude.append(f"    {f.name} = {attr}")
+            inner = ", ".join(f"{sub.name!r}: {f.name}.{sub.name}" for sub in fields(f.type))
+            entries.append(f"{f.name!r}: {{{inner}}}")
+        else:
+            entries.append(f"{f.name!r}: {attr}")
+    src = "def to_dict(self):\n{}    return {{\n        {}\n    }}\n".format(
+        "".join(line + "\n" for line in prelude),
+        ",\n        ".join(entries)
+    )
+    namespace: Dict[str, Any] = {}
+    exec(compile(src, f"<{cls.__name__}.to_dict>", "exec"), namespace)
+    to_dict = namespace["to_dict"]
+    to_dict.__qualname__ = f"{cls.__name__}.to_dict"
+    to_dict.__annotations__ = {"return": Dict[str, Any]}
+    cls.to_dict = to_dict
+    return cls
+
+
+def _compiled_from_dict(cls):
+    """
+    Class decorator: generate a straight-line from_dict() classmethod.
+
+    The generated constructor reads every field with one data.get(); unknown
+    keys are ignored and missing keys fall back to the field defaults. Enum
+    fields are converted from their value, nested dataclasses with their own
+    from_dict() use it for non-empty data (else their defaults), and nested
+    dataclasses without one are built inline from their sub-dict. init=False
+    fields are left to their defaults. Must be applied above @dataclass.
+
+    Plain mutable classes skip __init__: the instance comes from
+    object.__new__ and each field is stored directly, which avoids binding
+    every value as a keyword argument. Frozen classes and classes with their
+    own __setattr__ or __post_init__ go through cls() as usual.
+    """
+    namespace: Dict[str, Any] = {"_new": object.__new__}
+    prelude = []
+    args = []
+    direct = cls.__setattr__ is object.__setattr__ and not hasattr(cls, "__post_init__")
+
+    def default_expr(f, prefix: str) -> str:
+        if f.default_factory is not MISSING:
+            namespace[f"_f_{prefix}{f.name}"] = f.default_factory
+            return f"_f_{prefix}{f.name}()"
+        namespace[f"_d_{prefix}{f.name}"] = f.default
+        return f"_d_{prefix}{f.name}"
+
+    def get_expr(f, source: str, prefix: str = "") -> str:
+        if f.default_factory is not MISSING:
+            # Only call the factory when the key is absent
+            return (f"({source}[{f.name!r}] if {f.name!r} in {source} "
+                    f"else {default_expr(f, prefix)})")
+        return f"{source}.get({f.name!r}, {default_expr(f, prefix)})"
+
+    for f in fields(cls):
+        if not f.init:
+            if direct:
+                args.append((f.name, default_expr(f, "")))
+            continue
+        if isinstance(f.type, type) and issubclass(f.type, Enum):
+            # Plain dict lookup by value; Enum() is only called for unknown
+            # values, so invalid data still raises ValueError
+            namespace[f"_e_{f.name}"] = f.type
+            namespace[f"_v_{f.name}"] = _enum_by_value(f.type)
+            namespace[f"_d_{f.name}"] = f.default.value
+            prelude.append(f"    {f.name} = data.get({f.name!r}, _d_{f.name})")
+            args.append((f.name, f"_v_{f.name}.get({f.name}) or _e_{f.name}({f.name})"))
+        elif is_dataclass(f.type) and hasattr(f.type, "from_dict"):
+            namespace[f"_t_{f.name}"] = f.type
+            prelude.append(f"    {f.name} = data.get({f.name!r})")
+            args.append((f.name, f"_t_{f.name}.from_dict({f.name}) if {f.name} else _t_{f.name}()"))
+        elif is_dataclass(f.type):
+            namespace[f"_t_{f.name}"] = f.type
+            prelude.append(f"    {f.name} = data.get({f.name!r}, {{}})")
+            inner = ", ".join(
+                f"{sub.name}={get_expr(sub, f.name, f.name + '_')}" for sub in fields(f.type)
+            )
+            args.append((f.name, f"_t_{f.name}({inner})"))
+        else:
+            args.append((f.name, get_expr(f, "data")))
+
+    if direct:
+        body = "    _obj = _new(cls)\n{}    return _obj\n".format(
+            "".join(f"    _obj.{name} = {expr}\n" for name, expr in args)
+        )
+    else:
+        body = "    return cls(\n        {}\n    )\n".format(
+            ",\n        ".join(f"{name}={expr}" for name, expr in args)
+        )
+    src = "def from_dict(cls, data):\n{}{}".format(
+        "".join(line + "\n" for line in prelude),
+        body
+    )
+    exec(compile(src, f"<{cls.__name__}.from_dict>", "exec"), namespace)
+    from_dict = namespace["from_dict"]
+    from_dict.__qualname__ = f"{cls.__name__}.from_dict"
+    cls.from_dict = classmethod(from_dict)
+    return cls
+
+
+@dataclass(slots=True)
 class CameraSettings:
     """Camera parameters for a shot"""
     distance: str = "medium"  # extreme_wide, wide, medium_wide, medium, close
@@ -55,7 +323,7 @@ class CameraSettings:
     focal_length: int = 50  # mm
 
 
-@dataclass
+@dataclass(slots=True)
 class CompositionSettings:
     """Composition parameters for a shot"""
     subject_scale: float = 0.5  # 0.0-1.0 ratio in frame
@@ -67,7 +335,7 @@ class CompositionSettings:
     background_blur: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class SlotWeights:
     """Weight distribution for different reference slots"""
     character: float = 0.8
@@ -77,19 +345,18 @@ class SlotWeights:
 
     def normalize(self, max_total: float = 2.5) -> 'SlotWeights':
         """Normalize weights to prevent generation chaos"""
-        total = self.character + self.scene + self.props + self.style
+        character, scene, props, style = self.character, self.scene, self.props, self.style
+        total = character + scene + props + style
         if total > max_total:
             scale = max_total / total
-            return SlotWeights(
-                character=self.character * scale,
-                scene=self.scene * scale,
-                props=self.props * scale,
-                style=self.style * scale
-            )
+            return SlotWeights(character * scale, scene * scale, props * scale, style * scale)
         return self
 
 
-@dataclass
+@_compiled_to_dict
+@_interned_from_dict
+@_compiled_from_dict
+@dataclass(frozen=True, slots=True)
 class CharacterAppearance:
     """Detailed character appearance for consistency"""
     gender: str = ""  # male, female, other
@@ -114,85 +381,23 @@ class CharacterAppearance:
     scars: str = ""
     tattoos: str = ""
     other_features: str = ""  # moles, freckles, dimples, etc.
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "gender": self.gender,
-            "age": self.age,
-            "ethnicity": self.ethnicity,
-            "skin_tone": self.skin_tone,
-            "height": self.height,
-            "body_type": self.body_type,
-            "face_shape": self.face_shape,
-            "eye_color": self.eye_color,
-            "eye_shape": self.eye_shape,
-            "nose": self.nose,
-            "lips": self.lips,
-            "hair_color": self.hair_color,
-            "hair_style": self.hair_style,
-            "hair_texture": self.hair_texture,
-            "facial_hair": self.facial_hair,
-            "glasses": self.glasses,
-            "scars": self.scars,
-            "tattoos": self.tattoos,
-            "other_features": self.other_features
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'CharacterAppearance':
-        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+    # Memoized to_prompt_string() result; safe because instances are frozen
+    _prompt_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def to_prompt_string(self) -> str:
         """Generate consistent appearance prompt string"""
-        parts = []
-        if self.gender:
-            parts.append(self.gender)
-        if self.age:
-            age_map = {
-                "child": "young child",
-                "teen": "teenager",
-                "young_adult": "young adult in their 20s",
-                "adult": "adult in their 30s",
-                "middle_aged": "middle-aged person in their 40s-50s",
-                "elderly": "elderly person"
-            }
-            parts.append(age_map.get(self.age, self.age))
-        if self.ethnicity:
-            parts.append(f"{self.ethnicity} ethnicity")
-        if self.skin_tone:
-            parts.append(f"{self.skin_tone} skin")
-        if self.height:
-            parts.append(f"{self.height} height")
-        if self.body_type:
-            parts.append(f"{self.body_type} build")
-        if self.face_shape:
-            parts.append(f"{self.face_shape} face")
-        if self.eye_color:
-            parts.append(f"{self.eye_color} eyes")
-        if self.eye_shape:
-            parts.append(f"{self.eye_shape} eye shape")
-        if self.hair_color and self.hair_style:
-            parts.append(f"{self.hair_color} {self.hair_style} hair")
-        elif self.hair_color:
-            parts.append(f"{self.hair_color} hair")
-        elif self.hair_style:
-            parts.append(f"{self.hair_style} hair")
-        if self.hair_texture:
-            parts.append(f"{self.hair_texture} hair texture")
-        if self.facial_hair and self.facial_hair != "none":
-            parts.append(f"with {self.facial_hair}")
-        if self.glasses and self.glasses != "none":
-            parts.append(f"wearing {self.glasses} glasses")
-        if self.scars:
-            parts.append(f"scar: {self.scars}")
-        if self.tattoos:
-            parts.append(f"tattoo: {self.tattoos}")
-        if self.other_features:
-            parts.append(self.other_features)
-        return ", ".join(parts)
-
-
-@dataclass
+        cached = self._prompt_cache
+        if cached is not None:
+            return cached
+        prompt = _build_appearance_prompt(self)
+        object.__setattr__(self, "_prompt_cache", prompt)
+        return prompt
+
+
+@_compiled_to_dict
+@_interned_from_dict
+@_compiled_from_dict
+@dataclass(frozen=True, slots=True)
 class CharacterOutfit:
     """Character clothing/outfit for consistency"""
     top: str = ""  # shirt, blouse, jacket, etc.
@@ -204,49 +409,32 @@ class CharacterOutfit:
     footwear: str = ""
     accessories: str = ""  # hat, scarf, jewelry, watch
     style_keywords: str = ""  # casual, formal, streetwear, vintage
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "top": self.top,
-            "top_color": self.top_color,
-            "bottom": self.bottom,
-            "bottom_color": self.bottom_color,
-            "outerwear": self.outerwear,
-            "outerwear_color": self.outerwear_color,
-            "footwear": self.footwear,
-            "accessories": self.accessories,
-            "style_keywords": self.style_keywords
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'CharacterOutfit':
-        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+    # Memoized to_prompt_string() result; safe because instances are frozen
+    _prompt_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def to_prompt_string(self) -> str:
         """Generate consistent outfit prompt string"""
-        parts = []
-        if self.style_keywords:
-            parts.append(f"{self.style_keywords} style")
-        if self.top:
-            top_desc = f"{self.top_color} {self.top}".strip() if self.top_color else self.top
-            parts.append(f"wearing {top_desc}")
-        if self.bottom:
-            bottom_desc = f"{self.bottom_color} {self.bottom}".strip() if self.bottom_color else self.bottom
-            parts.append(bottom_desc)
-        if self.outerwear:
-            outer_desc = f"{self.outerwear_color} {self.outerwear}".strip() if self.outerwear_color else self.outerwear
-            parts.append(outer_desc)
-        if self.footwear:
-            parts.append(self.footwear)
-        if self.accessories:
-            parts.append(f"accessories: {self.accessories}")
-        return ", ".join(parts)
-
-
-@dataclass
+        cached = self._prompt_cache
+        if cached is not None:
+            return cached
+        prompt = ", ".join(filter(None, (
+            self.style_keywords and f"{self.style_keywords} style",
+            self.top and f"wearing {_colored(self.top_color, self.top)}",
+            self.bottom and _colored(self.bottom_color, self.bottom),
+            self.outerwear and _colored(self.outerwear_color, self.outerwear),
+            self.footwear,
+            self.accessories and f"accessories: {self.accessories}",
+        )))
+        object.__setattr__(self, "_prompt_cache", prompt)
+        return prompt
+
+
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class Character:
     """Character entity for reference slot"""
-    id: str = field(default_factory=lambda: f"char_{uuid.uuid4().hex[:8]}")
+    id: str = field(default_factory=lambda: _make_id("char"))
     name: str = ""
     ref_images: List[str] = field(default_factory=list)  # 3-5 images recommended
     features_locked: List[str] = field(default_factory=lambda: ["face", "body_type", "hair"])
@@ -256,58 +444,47 @@ class Character:
     # New: Detailed appearance for consistency
     appearance: CharacterAppearance = field(default_factory=CharacterAppearance)
     outfit: CharacterOutfit = field(default_factory=CharacterOutfit)
+    # (appearance_str, outfit_str, prompt) from the last get_consistency_prompt()
+    _prompt_cache: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "name": self.name,
-            "ref_images": self.ref_images,
-            "features_locked": self.features_locked,
-            "costume_locked": self.costume_locked,
-            "consistency_weight": self.consistency_weight,
-            "description": self.description,
-            "appearance": self.appearance.to_dict(),
-            "outfit": self.outfit.to_dict()
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Character':
-        appearance_data = data.pop("appearance", {})
-        outfit_data = data.pop("outfit", {})
-        char = cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
-        if appearance_data:
-            char.appearance = CharacterAppearance.from_dict(appearance_data)
-        if outfit_data:
-            char.outfit = CharacterOutfit.from_dict(outfit_data)
-        return char
+    __setattr__ = _invalidating_setattr
 
     def get_consistency_prompt(self) -> str:
         """Generate full consistency prompt for this character"""
+        # Sub-prompts come from their own caches; comparing them covers the
+        # appearance/outfit being swapped for another instance
+        appearance_str = self.appearance.to_prompt_string()
+        outfit_str = self.outfit.to_prompt_string() if self.costume_locked else ""
+        cached = self._prompt_cache
+        if cached is not None and cached[0] == appearance_str and cached[1] == outfit_str:
+            return cached[2]
+
         parts = [f"[{self.name}:"]
 
         # Appearance
-        appearance_str = self.appearance.to_prompt_string()
         if appearance_str:
             parts.append(appearance_str)
 
         # Outfit (if locked)
-        if self.costume_locked:
-            outfit_str = self.outfit.to_prompt_string()
-            if outfit_str:
-                parts.append(outfit_str)
+        if outfit_str:
+            parts.append(outfit_str)
 
         # Fallback to description if no detailed appearance
         if not appearance_str and self.description:
             parts.append(self.description)
 
         parts.append("]")
-        return " ".join(parts)
+        prompt = " ".join(parts)
+        self._prompt_cache = (appearance_str, outfit_str, prompt)
+        return prompt
 
 
-@dataclass
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class Scene:
     """Scene entity for reference slot"""
-    id: str = field(default_factory=lambda: f"scene_{uuid.uuid4().hex[:8]}")
+    id: str = field(default_factory=lambda: _make_id("scene"))
     name: str = ""
     space_ref_image: str = ""  # Physical layout reference
     atmosphere_ref_image: str = ""  # Optional: lighting/time reference
@@ -317,50 +494,22 @@ class Scene:
     color_temperature: str = ""  # e.g., "warm", "cool", "neutral"
     consistency_weight: float = 0.6
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "name": self.name,
-            "space_ref_image": self.space_ref_image,
-            "atmosphere_ref_image": self.atmosphere_ref_image,
-            "description": self.description,
-            "locked_features": self.locked_features,
-            "light_direction": self.light_direction,
-            "color_temperature": self.color_temperature,
-            "consistency_weight": self.consistency_weight
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Scene':
-        return cls(**data)
 
-
-@dataclass
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class Prop:
     """Prop entity for reference slot"""
-    id: str = field(default_factory=lambda: f"prop_{uuid.uuid4().hex[:8]}")
+    id: str = field(default_factory=lambda: _make_id("prop"))
     name: str = ""
     ref_image: str = ""  # Best if white background cutout
     size_reference: str = ""  # e.g., "palm-sized"
     material: str = ""  # e.g., "metal", "wood", "fabric"
     consistency_weight: float = 0.7
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "name": self.name,
-            "ref_image": self.ref_image,
-            "size_reference": self.size_reference,
-            "material": self.material,
-            "consistency_weight": self.consistency_weight
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Prop':
-        return cls(**data)
-
 
-@dataclass
+@_compiled_to_dict
+@dataclass(slots=True)
 class StyleConfig:
     """Style configuration for reference slot"""
     mode: StyleMode = StyleMode.PRESET
@@ -373,27 +522,17 @@ class StyleConfig:
     texture: str = "digital_clean"  # film_grain, digital_clean, noise
     weight: float = 0.4  # Recommend <= 0.5
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "mode": self.mode.value,
-            "preset_name": self.preset_name,
-            "ref_image": self.ref_image,
-            "custom_description": self.custom_description,
-            "render_type": self.render_type,
-            "color_tone": self.color_tone,
-            "lighting_style": self.lighting_style,
-            "texture": self.texture,
-            "weight": self.weight
-        }
-
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'StyleConfig':
         data = data.copy()
-        data["mode"] = StyleMode(data["mode"])
+        mode = data["mode"]
+        data["mode"] = _STYLE_MODE_BY_VALUE.get(mode) or StyleMode(mode)
         return cls(**data)
 
 
-@dataclass
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class StandardShotPrompt:
     """Standard shot prompt template for professional storyboarding"""
     subject: str = ""             # 主体: 主要角色/物体
@@ -407,54 +546,25 @@ class StandardShotPrompt:
     style_consistency: str = ""   # 风格统一: 色调/光影/质感描述
     dynamic_control: str = ""     # 动态控制: 具体动作描述
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "subject": self.subject,
-            "shot_type": self.shot_type,
-            "atmosphere": self.atmosphere,
-            "environment": self.environment,
-            "camera_movement": self.camera_movement,
-            "angle": self.angle,
-            "special_technique": self.special_technique,
-            "composition": self.composition,
-            "style_consistency": self.style_consistency,
-            "dynamic_control": self.dynamic_control
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'StandardShotPrompt':
-        # 兼容旧数据（没有subject字段）
-        if 'subject' not in data:
-            data['subject'] = ''
-        return cls(**data)
-
     def to_formatted_string(self) -> str:
         """Generate formatted standard prompt string"""
-        lines = []
-        if self.subject:
-            lines.append(f"主体: {self.subject}")
-        if self.shot_type:
-            lines.append(f"景别: {self.shot_type}")
-        if self.atmosphere:
-            lines.append(f"氛围: {self.atmosphere}")
-        if self.environment:
-            lines.append(f"环境: {self.environment}")
-        if self.camera_movement:
-            lines.append(f"运镜: {self.camera_movement}")
-        if self.angle:
-            lines.append(f"视角: {self.angle}")
-        if self.special_technique:
-            lines.append(f"特殊拍摄手法: {self.special_technique}")
-        if self.composition:
-            lines.append(f"构图: {self.composition}")
-        if self.style_consistency:
-            lines.append(f"风格统一: {self.style_consistency}")
-        if self.dynamic_control:
-            lines.append(f"动态控制: {self.dynamic_control}")
-        return "\n".join(lines)
-
-
-@dataclass
+        return "\n".join(filter(None, (
+            self.subject and f"主体: {self.subject}",
+            self.shot_type and f"景别: {self.shot_type}",
+            self.atmosphere and f"氛围: {self.atmosphere}",
+            self.environment and f"环境: {self.environment}",
+            self.camera_movement and f"运镜: {self.camera_movement}",
+            self.angle and f"视角: {self.angle}",
+            self.special_technique and f"特殊拍摄手法: {self.special_technique}",
+            self.composition and f"构图: {self.composition}",
+            self.style_consistency and f"风格统一: {self.style_consistency}",
+            self.dynamic_control and f"动态控制: {self.dynamic_control}",
+        )))
+
+
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class Shot:
     """Single storyboard shot"""
     shot_number: int = 1
@@ -474,105 +584,79 @@ class Shot:
     output_video: str = ""  # 生成的视频路径
     consistency_score: float = 0.0
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "shot_number": self.shot_number,
-            "template": self.template.value,
-            "description": self.description,
-            "characters_in_shot": self.characters_in_shot,
-            "scene_id": self.scene_id,
-            "props_in_shot": self.props_in_shot,
-            "camera": {
-                "distance": self.camera.distance,
-                "vertical_angle": self.camera.vertical_angle,
-                "horizontal_angle": self.camera.horizontal_angle,
-                "focal_length": self.camera.focal_length
-            },
-            "composition": {
-                "subject_scale": self.composition.subject_scale,
-                "horizon_position": self.composition.horizon_position,
-                "depth_layers": self.composition.depth_layers,
-                "rule_of_thirds": self.composition.rule_of_thirds,
-                "subject_position": self.composition.subject_position,
-                "foreground_blur": self.composition.foreground_blur,
-                "background_blur": self.composition.background_blur
-            },
-            "slot_weights": {
-                "character": self.slot_weights.character,
-                "scene": self.slot_weights.scene,
-                "props": self.slot_weights.props,
-                "style": self.slot_weights.style
-            },
-            "dialogue": self.dialogue,
-            "action": self.action,
-            "generated_prompt": self.generated_prompt,
-            "standard_prompt": self.standard_prompt.to_dict(),
-            "output_image": self.output_image,
-            "output_video": self.output_video,
-            "consistency_score": self.consistency_score
-        }
 
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Shot':
-        shot = cls()
-        shot.shot_number = data.get("shot_number", 1)
-        shot.template = ShotTemplate(data.get("template", "T4_standard_medium"))
-        shot.description = data.get("description", "")
-        shot.characters_in_shot = data.get("characters_in_shot", [])
-        shot.scene_id = data.get("scene_id", "")
-        shot.props_in_shot = data.get("props_in_shot", [])
-
-        cam_data = data.get("camera", {})
-        shot.camera = CameraSettings(
-            distance=cam_data.get("distance", "medium"),
-            vertical_angle=cam_data.get("vertical_angle", 0),
-            horizontal_angle=cam_data.get("horizontal_angle", 0),
-            focal_length=cam_data.get("focal_length", 50)
-        )
+class _TrackedList(list):
+    """
+    List that counts its mutations, so id indexes built over it can tell
+    when they are stale. Behaves exactly like a list otherwise.
+    """
+    _version = 0
 
-        comp_data = data.get("composition", {})
-        shot.composition = CompositionSettings(
-            subject_scale=comp_data.get("subject_scale", 0.5),
-            horizon_position=comp_data.get("horizon_position", "middle"),
-            depth_layers=comp_data.get("depth_layers", 2),
-            rule_of_thirds=comp_data.get("rule_of_thirds", True),
-            subject_position=comp_data.get("subject_position", "center"),
-            foreground_blur=comp_data.get("foreground_blur", False),
-            background_blur=comp_data.get("background_blur", False)
-        )
+    def _touch(self):
+        self._version += 1
 
-        weight_data = data.get("slot_weights", {})
-        shot.slot_weights = SlotWeights(
-            character=weight_data.get("character", 0.8),
-            scene=weight_data.get("scene", 0.6),
-            props=weight_data.get("props", 0.5),
-            style=weight_data.get("style", 0.4)
-        )
+    def append(self, item):
+        super().append(item)
+        self._touch()
 
-        shot.dialogue = data.get("dialogue", "")
-        shot.action = data.get("action", "")
-        shot.generated_prompt = data.get("generated_prompt", "")
+    def extend(self, items):
+        super().extend(items)
+        self._touch()
 
-        # 解析标准提示语
-        std_prompt_data = data.get("standard_prompt", {})
-        if std_prompt_data:
-            shot.standard_prompt = StandardShotPrompt.from_dict(std_prompt_data)
-        else:
-            shot.standard_prompt = StandardShotPrompt()
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._touch()
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        self._touch()
+        return item
+
+    def remove(self, item):
+        super().remove(item)
+        self._touch()
+
+    def clear(self):
+        super().clear()
+        self._touch()
 
-        shot.output_image = data.get("output_image", "")
-        shot.output_video = data.get("output_video", "")
-        shot.consistency_score = data.get("consistency_score", 0.0)
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._touch()
 
-        return shot
+    def reverse(self):
+        super().reverse()
+        self._touch()
 
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._touch()
 
-@dataclass
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._touch()
+
+    def __iadd__(self, items):
+        result = super().__iadd__(items)
+        self._touch()
+        return result
+
+    def __imul__(self, n):
+        result = super().__imul__(n)
+        self._touch()
+        return result
+
+
+# Reference lists of StoryboardProject that get an id -> entity index
+_INDEXED_FIELDS = frozenset({"characters", "scenes", "props"})
+
+
+@dataclass(slots=True)
 class StoryboardProject:
     """Complete storyboard project"""
     name: str = "Untitled Project"
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
-    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    created_at: str = field(default_factory=_now_iso)
+    updated_at: str = field(default_factory=_now_iso)
     version: str = "1.0"
     aspect_ratio: str = "16:9"  # 16:9, 9:16, 1:1
 
@@ -592,23 +676,40 @@ class StoryboardProject:
     generation_seed: int = -1  # -1 for random, positive number to lock seed
     lock_seed: bool = True  # Whether to use fixed seed across all shots (default: enabled)
 
+    # Lookup cache: field name -> (list, list version, {id: entity})
+    _id_indexes: Dict[str, tuple] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        # Reference lists are stored as _TrackedList so raw append/pop calls
+        # anywhere in the app still invalidate the id indexes
+        if name in _INDEXED_FIELDS and not isinstance(value, _TrackedList):
+            value = _TrackedList(value)
+        object.__setattr__(self, name, value)
+
+    def _lookup_by_id(self, field_name: str, item_id: str):
+        """O(1) id lookup; the index is rebuilt lazily after the list changes"""
+        items = getattr(self, field_name)
+        cached = self._id_indexes.get(field_name)
+        if cached is not None and cached[0] is items and cached[1] == items._version:
+            item = cached[2].get(item_id)
+            if item is not None and item.id == item_id:
+                return item
+        # Stale index, miss or entity id edited in place: rebuild once, so a
+        # miss costs no more than the old linear scan
+        index = {}
+        for item in items:
+            index.setdefault(item.id, item)  # first match wins, as with a linear scan
+        self._id_indexes[field_name] = (items, items._version, index)
+        return index.get(item_id)
+
     def get_character_by_id(self, char_id: str) -> Optional[Character]:
-        for c in self.characters:
-            if c.id == char_id:
-                return c
-        return None
+        return self._lookup_by_id("characters", char_id)
 
     def get_scene_by_id(self, scene_id: str) -> Optional[Scene]:
-        for s in self.scenes:
-            if s.id == scene_id:
-                return s
-        return None
+        return self._lookup_by_id("scenes", scene_id)
 
     def get_prop_by_id(self, prop_id: str) -> Optional[Prop]:
-        for p in self.props:
-            if p.id == prop_id:
-                return p
-        return None
+        return self._lookup_by_id("props", prop_id)
 
     def get_consistency_prefix(self) -> str:
         """
@@ -619,39 +720,20 @@ class StoryboardProject:
 
         # Style consistency
         style_parts = []
-        if self.style.render_type:
-            render_map = {
-                "realistic": "photorealistic",
-                "illustration": "digital illustration",
-                "3d_render": "3D rendered",
-                "watercolor": "watercolor style",
-                "anime": "anime style",
-                "comic": "comic book style"
-            }
-            style_parts.append(render_map.get(self.style.render_type, self.style.render_type))
-
-        if self.style.color_tone:
-            tone_map = {
-                "warm": "warm color palette",
-                "cool": "cool color palette",
-                "high_saturation": "vibrant colors",
-                "low_saturation": "muted colors"
-            }
-            if self.style.color_tone in tone_map:
-                style_parts.append(tone_map[self.style.color_tone])
-
-        if self.style.lighting_style:
-            light_map = {
-                "natural": "natural lighting",
-                "studio": "studio lighting",
-                "cinematic": "cinematic lighting",
-                "neon": "neon lighting"
-            }
-            if self.style.lighting_style in light_map:
-                style_parts.append(light_map[self.style.lighting_style])
+        style = self.style
+        if style.render_type:
+            style_parts.append(_RENDER_MAP.get(style.render_type, style.render_type))
+
+        tone = _TONE_MAP.get(style.color_tone)
+        if tone:
+            style_parts.append(tone)
+
+        light = _LIGHT_MAP.get(style.lighting_style)
+        if light:
+            style_parts.append(light)
 
-        if self.style.custom_description:
-            style_parts.append(self.style.custom_description[:80])
+        if style.custom_description:
+            style_parts.append(style.custom_description[:80])
 
         if style_parts:
             parts.append(f"[Style: {', '.join(style_parts)}]")
@@ -669,7 +751,7 @@ class StoryboardProject:
             "project_meta": {
                 "name": self.name,
                 "created_at": self.created_at,
-                "updated_at": datetime.now().isoformat(),
+                "updated_at": _now_iso(),
                 "version": self.version,
                 "aspect_ratio": self.aspect_ratio,
                 "generation_seed": self.generation_seed,
@@ -685,14 +767,96 @@ class StoryboardProject:
             "storyboard": [shot.to_dict() for shot in self.shots]
         }
 
+    def _json_head(self, native: bool) -> Dict[str, Any]:
+        """
+        Document fields that precede the storyboard. With native=True the
+        entities stay dataclasses for orjson, otherwise they are to_dict()'ed.
+        """
+        if native:
+            references = {
+                "characters": self.characters,
+                "scenes": self.scenes,
+                "props": self.props,
+                "style": self.style
+            }
+        else:
+            references = {
+                "characters": [c.to_dict() for c in self.characters],
+                "scenes": [s.to_dict() for s in self.scenes],
+                "props": [p.to_dict() for p in self.props],
+                "style": self.style.to_dict()
+            }
+        return {
+            "project_meta": {
+                "name": self.name,
+                "created_at": self.created_at,
+                "updated_at": _now_iso(),
+                "version": self.version,
+                "aspect_ratio": self.aspect_ratio,
+                "generation_seed": self.generation_seed,
+                "lock_seed": self.lock_seed
+            },
+            "references": references,
+            "narrative": self.narrative_text
+        }
+
+    def dump_json(self) -> bytes:
+        """
+        Serialize to UTF-8 JSON bytes with the same layout and indentation as
+        json.dumps(self.to_dict(), ensure_ascii=False, indent=2). The output is
+        equivalent JSON, not identical bytes: orjson formats some floats
+        differently (1e20 vs 1e+20) and rejects ints wider than 64 bits.
+
+        With orjson the entity dataclasses are serialized natively in C, so the
+        intermediate to_dict() tree is never built.
+        """
+        if orjson is None:
+            return json.dumps(self.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+        document = self._json_head(native=True)
+        document["storyboard"] = self.shots
+        return orjson.dumps(document, option=orjson.OPT_INDENT_2)
+
+    def write_json(self, fp) -> None:
+        """
+        Write the same bytes as dump_json() to a binary file object, encoding
+        one shot at a time so the whole document is never held in memory.
+        """
+        if orjson is None:
+            def encode(obj) -> bytes:
+                if is_dataclass(obj):
+                    obj = obj.to_dict()
+                return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+        else:
+            def encode(obj) -> bytes:
+                return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+        head = self._json_head(native=orjson is not None)
+        if not self.shots:
+            head["storyboard"] = []
+            fp.write(encode(head))
+            return
+
+        # Drop the head's closing "\n}" and splice the storyboard array in by
+        # hand; JSON strings never contain raw newlines, so re-indenting each
+        # shot is a plain byte replace
+        fp.write(encode(head)[:-2])
+        separator = b',\n  "storyboard": [\n    '
+        for shot in self.shots:
+            fp.write(separator)
+            fp.write(encode(shot).replace(b"\n", b"\n    "))
+            separator = b",\n    "
+        fp.write(b"\n  ]\n}")
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'StoryboardProject':
-        project = cls()
-
         meta = data.get("project_meta", {})
+        # Only take a timestamp when one is actually missing, and share it
+        now = None if "created_at" in meta and "updated_at" in meta else _now_iso()
+        project = cls(
+            created_at=meta.get("created_at", now),
+            updated_at=meta.get("updated_at", now)
+        )
         project.name = meta.get("name", "Untitled Project")
-        project.created_at = meta.get("created_at", datetime.now().isoformat())
-        project.updated_at = meta.get("updated_at", datetime.now().isoformat())
         project.version = meta.get("version", "1.0")
         project.aspect_ratio = meta.get("aspect_ratio", "16:9")
         project.generation_seed = meta.get("generation_seed", -1)
@@ -711,10 +875,12 @@ class StoryboardProject:
         return project
 
 
-@dataclass
+@_compiled_to_dict
+@_compiled_from_dict
+@dataclass(slots=True)
 class GeneratedAsset:
     """Record of AI-generated asset (character/scene/prop image)"""
-    id: str = field(default_factory=lambda: f"asset_{uuid.uuid4().hex[:8]}")
+    id: str = field(default_factory=lambda: _make_id("asset"))
     asset_type: GeneratedAssetType = GeneratedAssetType.CHARACTER
     name: str = ""
     description: str = ""
@@ -728,78 +894,30 @@ class GeneratedAsset:
     review_summary: str = ""
     review_issues: List[str] = field(default_factory=list)
     review_suggestions: List[str] = field(default_factory=list)
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    created_at: str = field(default_factory=_now_iso)
     generation_time: float = 0.0
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "asset_type": self.asset_type.value,
-            "name": self.name,
-            "description": self.description,
-            "prompt": self.prompt,
-            "negative_prompt": self.negative_prompt,
-            "status": self.status.value,
-            "image_path": self.image_path,
-            "ref_image_path": self.ref_image_path,
-            "generation_params": self.generation_params,
-            "review_score": self.review_score,
-            "review_summary": self.review_summary,
-            "review_issues": self.review_issues,
-            "review_suggestions": self.review_suggestions,
-            "created_at": self.created_at,
-            "generation_time": self.generation_time
-        }
 
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'GeneratedAsset':
-        asset = cls()
-        asset.id = data.get("id", asset.id)
-        asset.asset_type = GeneratedAssetType(data.get("asset_type", "character"))
-        asset.name = data.get("name", "")
-        asset.description = data.get("description", "")
-        asset.prompt = data.get("prompt", "")
-        asset.negative_prompt = data.get("negative_prompt", "")
-        asset.status = AssetGenerationStatus(data.get("status", "pending"))
-        asset.image_path = data.get("image_path", "")
-        asset.ref_image_path = data.get("ref_image_path", "")
-        asset.generation_params = data.get("generation_params", {})
-        asset.review_score = data.get("review_score", 0.0)
-        asset.review_summary = data.get("review_summary", "")
-        asset.review_issues = data.get("review_issues", [])
-        asset.review_suggestions = data.get("review_suggestions", [])
-        asset.created_at = data.get("created_at", datetime.now().isoformat())
-        asset.generation_time = data.get("generation_time", 0.0)
-        return asset
-
-
-@dataclass
+@_compiled_to_dict
+@_interned_from_dict
+@_compiled_from_dict
+@dataclass(frozen=True, slots=True)
 class ComfyUISettings:
-    """ComfyUI connection settings"""
+    """ComfyUI connection settings (immutable; build a new one to change it)"""
     host: str = "127.0.0.1"
     port: int = 8188
     use_https: bool = False
     custom_workflow_path: str = ""
     default_model: str = ""
     timeout: int = 300
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "host": self.host,
-            "port": self.port,
-            "use_https": self.use_https,
-            "custom_workflow_path": self.custom_workflow_path,
-            "default_model": self.default_model,
-            "timeout": self.timeout
-        }
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'ComfyUISettings':
-        return cls(
-            host=data.get("host", "127.0.0.1"),
-            port=data.get("port", 8188),
-            use_https=data.get("use_https", False),
-            custom_workflow_path=data.get("custom_workflow_path", ""),
-            default_model=data.get("default_model", ""),
-            timeout=data.get("timeout", 300)
-        )
+    # Memoized base_url; safe because instances are frozen
+    _base_url: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def base_url(self) -> str:
+        base_url = self._base_url
+        if base_url is None:
+            protocol = "https" if self.use_https else "http"
+            base_url = f"{protocol}://{self.host}:{self.port}"
+            object.__setattr__(self, "_base_url", base_url)
+        return base_url
@@ -5,6 +5,7 @@
 
 import os
 import json
+import asyncio
 import shutil
 import zipfile
 from pathlib import Path
@@ -20,9 +21,15 @@ from models import (
 from templates import get_template
 from prompt_generator import generate_shot_prompt
 from image_generator import create_generator, GenerationResult
-from smart_import import SmartImporter, validate_and_fix_json
+from smart_import import SmartImporter, validate_and_fix_json, normalize_import_data
 from settings import settings
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
 
 # ========================================
 # 目录配置 - 从统一设置加载
@@ -186,8 +193,39 @@ class ProjectService:
         "水彩画": ("Watercolor", "watercolor", "natural"),
     }
 
+    # 变更计数的数据类别; "project" 随任一类别变化而递增
+    VERSION_KINDS = ("project", "characters", "scenes", "shots")
+
     def __init__(self):
-        self.current_project: Optional[StoryboardProject] = None
+        self._current_project: Optional[StoryboardProject] = None
+        # 变更计数 - 单调递增，供 UI 层判断数据是否变化以复用缓存
+        self._versions: Dict[str, int] = dict.fromkeys(self.VERSION_KINDS, 0)
+
+    @property
+    def current_project(self) -> Optional[StoryboardProject]:
+        return self._current_project
+
+    @current_project.setter
+    def current_project(self, project: Optional[StoryboardProject]):
+        self._current_project = project
+        # 替换项目后所有数据都视为已变化
+        self.touch(*self.VERSION_KINDS)
+
+    @property
+    def version(self) -> int:
+        """项目数据变更计数 (任何角色/场景/镜头变化都会递增)"""
+        return self._versions["project"]
+
+    def version_of(self, kind: str) -> int:
+        """获取某类数据的变更计数"""
+        return self._versions[kind]
+
+    def touch(self, *kinds: str) -> None:
+        """标记数据已变化"""
+        for kind in kinds:
+            self._versions[kind] += 1
+        if "project" not in kinds:
+            self._versions["project"] += 1
 
     def create_project(self, name: str, aspect_ratio: str = "16:9") -> Dict[str, Any]:
         """创建新项目"""
@@ -258,6 +296,7 @@ class ProjectService:
             lighting_style=light,
             weight=0.4
         )
+        self.touch("project")
 
         return {"success": True, "message": f"风格已设为「{style_name}」"}
 
@@ -356,6 +395,11 @@ class CharacterService:
     def project(self):
         return self.project_service.current_project
 
+    @property
+    def version(self) -> int:
+        """角色列表变更计数"""
+        return self.project_service.version_of("characters")
+
     def add_character(self, name: str, description: str, ref_images: List[str] = None) -> Dict[str, Any]:
         """添加角色"""
         if self.project is None:
@@ -371,6 +415,7 @@ class CharacterService:
             consistency_weight=0.85
         )
         self.project.characters.append(char)
+        self.project_service.touch("characters")
 
         return {
             "success": True,
@@ -386,6 +431,7 @@ class CharacterService:
         for i, c in enumerate(self.project.characters):
             if c.id == character_id or c.name == character_id:
                 self.project.characters.pop(i)
+                self.project_service.touch("characters")
                 return {"success": True, "message": f"角色「{c.name}」已删除"}
 
         return {"success": False, "message": "未找到该角色"}
@@ -414,6 +460,11 @@ class SceneService:
     def project(self):
         return self.project_service.current_project
 
+    @property
+    def version(self) -> int:
+        """场景列表变更计数"""
+        return self.project_service.version_of("scenes")
+
     def add_scene(self, name: str, description: str, ref_image: str = "") -> Dict[str, Any]:
         """添加场景"""
         if self.project is None:
@@ -429,6 +480,7 @@ class SceneService:
             consistency_weight=0.7
         )
         self.project.scenes.append(scene)
+        self.project_service.touch("scenes")
 
         return {
             "success": True,
@@ -444,6 +496,7 @@ class SceneService:
         for i, s in enumerate(self.project.scenes):
             if s.id == scene_id or s.name == scene_id:
                 self.project.scenes.pop(i)
+                self.project_service.touch("scenes")
                 return {"success": True, "message": f"场景「{s.name}」已删除"}
 
         return {"success": False, "message": "未找到该场景"}
@@ -474,6 +527,11 @@ class ShotService:
     def project(self):
         return self.project_service.current_project
 
+    @property
+    def version(self) -> int:
+        """镜头列表变更计数"""
+        return self.project_service.version_of("shots")
+
     def add_shot(self, template_name: str, description: str,
                  character_ids: List[str] = None, scene_id: str = "") -> Dict[str, Any]:
         """添加镜头"""
@@ -501,6 +559,7 @@ class ShotService:
 
         shot.generated_prompt = generate_shot_prompt(shot, self.project)
         self.project.shots.append(shot)
+        self.project_service.touch("shots")
 
         return {
             "success": True,
@@ -523,6 +582,7 @@ class ShotService:
             # 重新编号
             for i, s in enumerate(self.project.shots):
                 s.shot_number = i + 1
+            self.project_service.touch("shots")
             return {"success": True, "message": "镜头已删除"}
 
         return {"success": False, "message": "无效的镜头编号"}
@@ -548,6 +608,7 @@ class ShotService:
         # 重新编号
         for i, s in enumerate(self.project.shots):
             s.shot_number = i + 1
+        self.project_service.touch("shots")
 
         return {"success": True, "message": f"镜头已{'上移' if direction == 'up' else '下移'}"}
 
@@ -556,22 +617,17 @@ class ShotService:
         if self.project is None:
             return []
 
+        char_names_by_id, scene_names_by_id = self._name_lookups()
+
         result = []
         for s in self.project.shots:
             template = get_template(s.template)
 
             # 获取角色名
-            char_names = []
-            for cid in s.characters_in_shot:
-                for c in self.project.characters:
-                    if c.id == cid:
-                        char_names.append(c.name)
+            char_names = [char_names_by_id[cid] for cid in s.characters_in_shot if cid in char_names_by_id]
 
             # 获取场景名
-            scene_name = ""
-            for sc in self.project.scenes:
-                if sc.id == s.scene_id:
-                    scene_name = sc.name
+            scene_name = scene_names_by_id.get(s.scene_id, "")
 
             result.append({
                 "id": f"shot_{s.shot_number}",  # 使用 shot_number 作为 id
@@ -579,12 +635,40 @@ class ShotService:
                 "template": template.name_cn if template else "标准",
                 "scene": scene_name,
                 "characters": char_names,
+                "characters_display": ", ".join(char_names) or "无角色",
                 "description": s.description,
                 "status": "completed" if s.output_image else "pending",
                 "output_image": s.output_image
             })
         return result
 
+    def list_shots_soa(self) -> Dict[str, List[Any]]:
+        """获取镜头列表的按字段并行数组形式, 供批量渲染逐行 zip 使用"""
+        shots = self.project.shots if self.project is not None else []
+        if not shots:
+            return {key: [] for key in ("numbers", "templates", "statuses", "descriptions", "scenes", "characters_display")}
+
+        char_names_by_id, scene_names_by_id = self._name_lookups()
+        templates = [get_template(s.template) for s in shots]
+        return {
+            "numbers": [s.shot_number for s in shots],
+            "templates": [t.name_cn if t else "标准" for t in templates],
+            "statuses": ["completed" if s.output_image else "pending" for s in shots],
+            "descriptions": [s.description for s in shots],
+            "scenes": [scene_names_by_id.get(s.scene_id, "") for s in shots],
+            "characters_display": [
+                ", ".join(char_names_by_id[cid] for cid in s.characters_in_shot if cid in char_names_by_id) or "无角色"
+                for s in shots
+            ],
+        }
+
+    def _name_lookups(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """角色/场景 id -> 名称映射"""
+        return (
+            {c.id: c.name for c in self.project.characters},
+            {sc.id: sc.name for sc in self.project.scenes},
+        )
+
 
 # ========================================
 # 生成服务
@@ -622,6 +706,7 @@ class GenerationService:
         if result.success:
             shot.output_image = result.image_path
             shot.consistency_score = result.consistency_score
+            self.project_service.touch("shots")
             return {
                 "success": True,
                 "message": f"镜头 {shot_number} 生成完成",
@@ -639,30 +724,46 @@ class GenerationService:
         if not self.project.shots:
             return {"success": False, "message": "请先添加镜头"}
 
-        success = 0
-        total = len(self.project.shots)
-        results = []
-
-        for shot in self.project.shots:
-            if not shot.output_image:
-                if not shot.generated_prompt:
-                    shot.generated_prompt = generate_shot_prompt(shot, self.project)
-
-                result = self.generator.generate_shot(shot, self.project, shot.generated_prompt)
-                if result.success:
-                    shot.output_image = result.image_path
-                    shot.consistency_score = result.consistency_score
-                    success += 1
-                    results.append({"shot_number": shot.shot_number, "success": True, "image_path": result.image_path})
-                else:
-                    results.append({"shot_number": shot.shot_number, "success": False, "error": result.error_message})
+        pending = self._pending_shots()
+        # 交给生成器的批量接口: 苍何后端并发请求, ComfyUI 后端流水线提交
+        outcomes = self.generator.generate_all_shots(self.project, {}, shots=pending) if pending else []
+        results = [self._record_batch_result(shot, result) for shot, result in zip(pending, outcomes)]
+        success = sum(1 for r in results if r["success"])
 
         return {
             "success": True,
-            "message": f"已生成 {success}/{total} 个镜头",
+            "message": f"已生成 {success}/{len(self.project.shots)} 个镜头",
             "results": results
         }
 
+    async def generate_all_async(self) -> Dict[str, Any]:
+        """
+        批量生成所有镜头 (异步接口)
+
+        在单个工作线程中执行 generate_all, 并发由生成器自身的批量接口控制:
+        苍何后端在其后台事件循环中并发请求, ComfyUI 后端按任务使用独立 client_id
+        流水线提交, 不会出现多个线程共用同一 client_id 等待完成消息的情况
+        """
+        return await asyncio.to_thread(self.generate_all)
+
+    def _pending_shots(self) -> List[Shot]:
+        """尚未生成图片的镜头, 顺带补全缺失的提示词"""
+        project = self.project
+        pending = [shot for shot in project.shots if not shot.output_image]
+        for shot in pending:
+            if not shot.generated_prompt:
+                shot.generated_prompt = generate_shot_prompt(shot, project)
+        return pending
+
+    def _record_batch_result(self, shot: Shot, result: GenerationResult) -> Dict[str, Any]:
+        """写回单个镜头的生成结果, 返回批量结果条目"""
+        if result.success:
+            shot.output_image = result.image_path
+            shot.consistency_score = result.consistency_score
+            self.project_service.touch("shots")
+            return {"shot_number": shot.shot_number, "success": True, "image_path": result.image_path}
+        return {"shot_number": shot.shot_number, "success": False, "error": result.error_message}
+
 
 # ========================================
 # 导入导出服务
@@ -674,6 +775,8 @@ class ImportExportService:
     def __init__(self, project_service: ProjectService):
         self.project_service = project_service
         self.smart_importer = SmartImporter()
+        # 最近一次智能导入的 (JSON 文本, 解析结果); 文本未被修改时应用导入无需再次解析
+        self._parsed_import: Optional[Tuple[str, Dict[str, Any]]] = None
 
     @property
     def project(self):
@@ -683,6 +786,14 @@ class ImportExportService:
         """智能导入文件"""
         result = self.smart_importer.import_file(filepath, use_claude)
 
+        self._parsed_import = None
+        analyzed_json = result.get("analyzed_json", "")
+        if result["success"] and analyzed_json:
+            try:
+                self._parsed_import = (analyzed_json, normalize_import_data(_loads(analyzed_json)))
+            except (ValueError, TypeError):
+                pass  # 留给 apply_import 报告格式错误
+
         return {
             "success": result["success"],
             "message": result["message"],
@@ -693,13 +804,16 @@ class ImportExportService:
 
     def apply_import(self, json_str: str) -> Dict[str, Any]:
         """应用导入的JSON"""
-        valid, fixed_json, error = validate_and_fix_json(json_str)
-        if not valid:
-            return {"success": False, "message": f"JSON格式错误: {error}"}
+        parsed, self._parsed_import = self._parsed_import, None
+        if parsed is not None and parsed[0] == json_str:
+            data = parsed[1]
+        else:
+            valid, fixed_json, error = validate_and_fix_json(json_str)
+            if not valid:
+                return {"success": False, "message": f"JSON格式错误: {error}"}
+            data = _loads(fixed_json)
 
         try:
-            data = json.loads(fixed_json)
-
             # 创建项目
             self.project_service.current_project = StoryboardProject(
                 name=data.get("project_name", "导入的项目"),
@@ -753,8 +867,8 @@ class ImportExportService:
             filename = f"{self.project.name}_{timestamp}.json"
             filepath = Config.EXPORTS_DIR / filename
 
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(self.project.to_dict(), f, ensure_ascii=False, indent=2)
+            with open(filepath, "wb") as f:
+                self.project.write_json(f)
 
             return {"success": True, "message": f"已导出 {filename}", "filepath": str(filepath)}
 
@@ -784,7 +898,7 @@ class ImportExportService:
             filepath = Config.EXPORTS_DIR / filename
 
             with zipfile.ZipFile(filepath, 'w') as zf:
-                zf.writestr("project.json", json.dumps(self.project.to_dict(), ensure_ascii=False, indent=2))
+                zf.writestr("project.json", self.project.dump_json())
 
                 for shot in self.project.shots:
                     if shot.output_image and os.path.exists(shot.output_image):
@@ -868,6 +982,10 @@ class AICreativeService:
             from comfyui_client import ComfyUIClient, ComfyUIConfig, create_comfyui_client_from_settings
             from models import ComfyUISettings
 
+            # Release the previous client's pooled connections
+            if self.comfyui_client is not None:
+                self.comfyui_client.close()
+
             # Use settings if host/port not provided
             if host is None or port is None:
                 # Use settings-based client
@@ -1165,6 +1283,7 @@ class AICreativeService:
                 if char.name == asset.name:
                     if asset.image_path not in char.ref_images:
                         char.ref_images.append(asset.image_path)
+                        self.project_service.touch("characters")
                     break
         elif asset.asset_type == GeneratedAssetType.SCENE:
             # Find and update scene
@@ -1172,6 +1291,7 @@ class AICreativeService:
                 if scene.name == asset.name:
                     if not scene.space_ref_image:
                         scene.space_ref_image = asset.image_path
+                        self.project_service.touch("scenes")
                     break
 
     def get_generated_assets(self) -> List[Dict]:
@@ -80,6 +80,10 @@ class Settings:
     api_host: str = field(default_factory=lambda: os.environ.get(
         "API_HOST", "0.0.0.0"
     ))
+    # 镜头/视频卡片缩略图以 base64 内嵌到 HTML; 关闭后改为通过 Gradio 文件路由直接传输原始图片
+    inline_card_images: bool = field(default_factory=lambda: os.environ.get(
+        "INLINE_CARD_IMAGES", "true"
+    ).lower() in ("true", "1", "yes"))
 
     # ===========================================
     # CORS 配置
@@ -127,6 +131,10 @@ class Settings:
     comfyui_model: str = field(default_factory=lambda: os.environ.get(
         "COMFYUI_MODEL", ""
     ))
+    # ComfyUI 输出目录 (ComfyUI 在本机运行时直接读取输出文件，跳过 HTTP 下载)
+    comfyui_output_dir: Optional[str] = field(default_factory=lambda: os.environ.get(
+        "COMFYUI_OUTPUT_DIR"
+    ))
 
     # ===========================================
     # Ollama 配置 (可选)
@@ -33,6 +33,19 @@ try:
 except ImportError:
     BeautifulSoup = None
 
+# JSON 加速 (可选)
+try:
+    import orjson
+    _loads = orjson.loads
+
+    def _dumps_pretty(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+except ImportError:
+    _loads = json.loads
+
+    def _dumps_pretty(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
 try:
     from PIL import Image
 except ImportError:
@@ -403,22 +416,26 @@ def validate_and_fix_json(json_str: str) -> Tuple[bool, str, str]:
     返回: (是否有效, 修复后的JSON, 错误信息)
     """
     try:
-        data = json.loads(json_str)
+        data = normalize_import_data(_loads(json_str))
+        return True, _dumps_pretty(data), ""
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError 亦为其子类
+        return False, json_str, f"JSON格式错误: {str(e)}"
 
-        # 验证必需字段
-        required_fields = ['project_name', 'characters', 'scenes', 'shots']
-        for field in required_fields:
-            if field not in data:
-                data[field] = [] if field in ['characters', 'scenes', 'shots'] else "未命名"
 
-        # 设置默认值
-        data.setdefault('description', '')
-        data.setdefault('aspect_ratio', '16:9')
-        data.setdefault('style', '电影感')
+def normalize_import_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """补全导入数据的必需字段和默认值 (原地修改并返回)"""
+    # 验证必需字段
+    required_fields = ['project_name', 'characters', 'scenes', 'shots']
+    for field in required_fields:
+        if field not in data:
+            data[field] = [] if field in ['characters', 'scenes', 'shots'] else "未命名"
 
-        return True, json.dumps(data, ensure_ascii=False, indent=2), ""
-    except json.JSONDecodeError as e:
-        return False, json_str, f"JSON格式错误: {str(e)}"
+    # 设置默认值
+    data.setdefault('description', '')
+    data.setdefault('aspect_ratio', '16:9')
+    data.setdefault('style', '电影感')
+
+    return data
 
 
 # 测试函数
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# web/ modules import each other as top-level modules (``import models``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
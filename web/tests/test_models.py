@@ -0,0 +1,229 @@
+"""Tests for the storyboard data models"""
+
+import copy
+import io
+import json
+
+import pytest
+
+import models
+from models import (
+    AssetGenerationStatus, CameraSettings, Character, CharacterAppearance,
+    CharacterOutfit, ComfyUISettings, GeneratedAsset, GeneratedAssetType, Prop,
+    Scene, Shot, ShotTemplate, SlotWeights, StandardShotPrompt, StoryboardProject,
+    StyleConfig, StyleMode
+)
+
+FIXED_NOW = "2024-01-02T03:04:05.000006"
+
+
+def _project(*char_ids):
+    project = StoryboardProject(name="test")
+    for char_id in char_ids:
+        project.characters.append(Character(id=char_id, name=char_id))
+    return project
+
+
+def test_lookup_by_id():
+    project = _project("a", "b")
+    project.scenes.append(Scene(id="s1", name="s1"))
+    project.props.append(Prop(id="p1", name="p1"))
+    assert project.get_character_by_id("b") is project.characters[1]
+    assert project.get_scene_by_id("s1") is project.scenes[0]
+    assert project.get_prop_by_id("p1") is project.props[0]
+    assert project.get_character_by_id("missing") is None
+
+
+def test_lookup_after_id_edited_in_place():
+    project = _project("a", "b")
+    char = project.characters[0]
+    assert project.get_character_by_id("a") is char
+    char.id = "renamed"
+    assert project.get_character_by_id("renamed") is char
+    assert project.get_character_by_id("a") is None
+    # Editing another entity onto an id that is already a miss in the index
+    project.characters[1].id = "a"
+    assert project.get_character_by_id("a") is project.characters[1]
+
+
+def test_lookup_after_slice_assignment():
+    project = _project("a", "b", "c")
+    assert project.get_character_by_id("b") is not None
+    project.characters[0:2] = [Character(id="x", name="x")]
+    assert project.get_character_by_id("a") is None
+    assert project.get_character_by_id("b") is None
+    assert project.get_character_by_id("x") is project.characters[0]
+    assert project.get_character_by_id("c") is project.characters[1]
+
+
+def test_lookup_after_del():
+    project = _project("a", "b", "c")
+    assert project.get_character_by_id("c") is not None
+    del project.characters[2]
+    assert project.get_character_by_id("c") is None
+    del project.characters[:1]
+    assert project.get_character_by_id("a") is None
+    assert project.get_character_by_id("b") is project.characters[0]
+
+
+def test_lookup_after_list_replaced():
+    project = _project("a")
+    assert project.get_character_by_id("a") is not None
+    project.characters = [Character(id="z", name="z")]
+    assert project.get_character_by_id("a") is None
+    assert project.get_character_by_id("z") is project.characters[0]
+
+
+def test_lookup_duplicate_ids_first_match_wins():
+    project = _project("a", "a")
+    assert project.get_character_by_id("a") is project.characters[0]
+
+
+def _sample_character():
+    return Character(
+        id="char_1", name="林", ref_images=["a.png", "b.png"], costume_locked=True,
+        consistency_weight=0.9, description="主角",
+        appearance=CharacterAppearance(gender="female", age="30", hair_color="black"),
+        outfit=CharacterOutfit(top="coat", top_color="red")
+    )
+
+
+def _sample_shot():
+    return Shot(
+        shot_number=3, template=ShotTemplate.T3_FRAMED_SHOT, description="门口",
+        characters_in_shot=["char_1"], scene_id="scene_1", props_in_shot=["prop_1"],
+        camera=CameraSettings(distance="close", vertical_angle=-10.5, focal_length=85),
+        slot_weights=SlotWeights(character=0.9, scene=0.3, props=0.2, style=0.1),
+        dialogue="你好", standard_prompt=StandardShotPrompt(subject="林", angle="低角度"),
+        output_image="out.png", consistency_score=0.75
+    )
+
+
+_SAMPLES = [
+    CharacterAppearance(gender="male", eye_color="brown", tattoos="dragon"),
+    CharacterOutfit(bottom="jeans", footwear="boots", accessories="watch"),
+    _sample_character(),
+    Scene(id="scene_1", name="客厅", locked_features=["lighting"], color_temperature="warm"),
+    Prop(id="prop_1", name="伞", material="fabric", consistency_weight=0.5),
+    StyleConfig(mode=StyleMode.CUSTOM_TEXT, custom_description="noir", weight=0.3),
+    StandardShotPrompt(subject="林", dynamic_control="转身"),
+    _sample_shot(),
+    GeneratedAsset(
+        id="asset_1", asset_type=GeneratedAssetType.SCENE,
+        status=AssetGenerationStatus.COMPLETED, generation_params={"seed": 7},
+        review_issues=["blur"], created_at=FIXED_NOW, generation_time=1.5
+    ),
+    ComfyUISettings(host="10.0.0.2", port=8190, use_https=True, timeout=60),
+]
+
+
+@pytest.mark.parametrize("obj", _SAMPLES, ids=lambda obj: type(obj).__name__)
+def test_round_trip(obj):
+    assert type(obj).from_dict(obj.to_dict()) == obj
+
+
+@pytest.mark.parametrize("obj", _SAMPLES, ids=lambda obj: type(obj).__name__)
+def test_default_round_trip(obj):
+    default = type(obj)()
+    assert type(obj).from_dict(default.to_dict()) == default
+
+
+def test_project_round_trip(monkeypatch):
+    monkeypatch.setattr(models, "_now_iso", lambda: FIXED_NOW)
+    project = StoryboardProject(
+        name="demo", created_at=FIXED_NOW, updated_at=FIXED_NOW, aspect_ratio="9:16",
+        characters=[_sample_character()], scenes=[_SAMPLES[3]], props=[_SAMPLES[4]],
+        style=_SAMPLES[5], narrative_text="很久以前", shots=[_sample_shot(), Shot()],
+        generation_seed=42, lock_seed=False
+    )
+    assert StoryboardProject.from_dict(project.to_dict()) == project
+
+
+@pytest.mark.parametrize("cls", [
+    CharacterAppearance, CharacterOutfit, Character, Scene, Prop,
+    StandardShotPrompt, Shot, GeneratedAsset, ComfyUISettings
+])
+def test_from_dict_missing_and_unknown_keys(cls):
+    obj = cls.from_dict({"unknown_key": 1})
+    default = cls()
+    if hasattr(default, "id"):
+        # Random ids differ between instances
+        assert obj.id.startswith(default.id.split("_")[0] + "_")
+        obj.id = default.id
+    if isinstance(default, GeneratedAsset):
+        obj.created_at = default.created_at
+    assert obj == default
+
+
+def test_from_dict_partial_nested_data():
+    shot = Shot.from_dict({"camera": {"distance": "wide"}, "slot_weights": {"scene": 0.1}})
+    assert shot.camera == CameraSettings(distance="wide")
+    assert shot.slot_weights == SlotWeights(scene=0.1)
+    assert shot.template is ShotTemplate.T4_STANDARD_MEDIUM
+
+
+def test_from_dict_default_factories_not_shared():
+    first = Shot.from_dict({})
+    second = Shot.from_dict({})
+    first.characters_in_shot.append("char_1")
+    first.camera.distance = "close"
+    first.slot_weights.character = 0.1
+    assert second.characters_in_shot == []
+    assert second.camera == CameraSettings()
+    assert second.slot_weights == SlotWeights()
+
+    first = Character.from_dict({})
+    second = Character.from_dict({})
+    first.ref_images.append("a.png")
+    first.features_locked.append("scar")
+    assert second.ref_images == []
+    assert second.features_locked == ["face", "body_type", "hair"]
+
+    first = GeneratedAsset.from_dict({})
+    second = GeneratedAsset.from_dict({})
+    first.generation_params["seed"] = 1
+    first.review_issues.append("blur")
+    assert second.generation_params == {}
+    assert second.review_issues == []
+
+
+@pytest.mark.parametrize("cls, data", [
+    (Shot, {"template": "T99_nonexistent"}),
+    (GeneratedAsset, {"status": "unknown"}),
+    (GeneratedAsset, {"asset_type": "vehicle"}),
+    (StyleConfig, {"mode": "bogus"}),
+])
+def test_from_dict_invalid_enum_raises(cls, data):
+    with pytest.raises(ValueError):
+        cls.from_dict(data)
+
+
+def test_character_from_dict_does_not_mutate_input():
+    data = _sample_character().to_dict()
+    data["unknown_key"] = "kept"
+    snapshot = copy.deepcopy(data)
+    Character.from_dict(data)
+    assert data == snapshot
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "json"])
+@pytest.mark.parametrize("shot_count", [0, 1, 5])
+def test_write_json_matches_dump_json(monkeypatch, use_orjson, shot_count):
+    if use_orjson and models.orjson is None:
+        pytest.skip("orjson not installed")
+    if not use_orjson:
+        monkeypatch.setattr(models, "orjson", None)
+    monkeypatch.setattr(models, "_now_iso", lambda: FIXED_NOW)
+    project = StoryboardProject(
+        name="demo", created_at=FIXED_NOW, characters=[_sample_character()],
+        narrative_text="第一行\n第二行", style=_SAMPLES[5]
+    )
+    for i in range(shot_count):
+        shot = _sample_shot()
+        shot.shot_number = i + 1
+        project.shots.append(shot)
+
+    buffer = io.BytesIO()
+    project.write_json(buffer)
+    assert buffer.getvalue() == project.dump_json()
+    assert json.loads(buffer.getvalue()) == project.to_dict()
@@ -0,0 +1,55 @@
+"""
+上传文件保存工具
+供 app.py 与 gradio_adapter.py 共用, 不依赖 UI 模块
+"""
+
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from settings import settings
+
+
+# 图片保存线程池 (磁盘写入期间释放 GIL, 多张图片可并行写入)
+_io_pool = ThreadPoolExecutor(max_workers=8)
+
+
+def save_uploaded_image(image, category: str, name: str) -> str:
+    """保存上传的图片"""
+    if image is None:
+        return ""
+
+    save_dir = settings.assets_dir / category
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    ext = ".png"
+    filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
+    save_path = save_dir / filename
+
+    if isinstance(image, str):
+        if os.path.exists(image):
+            shutil.copy(image, save_path)
+    else:
+        try:
+            from PIL import Image
+            if hasattr(image, 'save'):
+                image.save(save_path)
+            else:
+                Image.fromarray(image).save(save_path)
+        except:
+            return ""
+
+    return str(save_path)
+
+
+def save_multiple_images(images: List, category: str, name: str) -> List[str]:
+    """批量保存图片"""
+    if not images:
+        return []
+    futures = [
+        _io_pool.submit(save_uploaded_image, img, category, f"{name}_{i}")
+        for i, img in enumerate(images)
+    ]
+    return [path for path in (f.result() for f in futures) if path]